@@ -0,0 +1,102 @@
+import os
+import pickle
+import argparse
+from datetime import datetime, timedelta
+import pandas as pd
+from bson import Binary
+from pymongo import DESCENDING, ReturnDocument
+
+from anomaly_sub_api import fit_models
+import transaction_archive
+
+# One document per user in the anomaly_models collection:
+# {_id: user_id, models: <pickled {"daily", "single"}>, trained_at, trained_on,
+#  new_since: transactions uploaded since the last training}
+RETRAIN_AFTER = int(os.getenv("ANOMALY_RETRAIN_AFTER", "500"))
+MAX_AGE_DAYS = int(os.getenv("ANOMALY_MODEL_MAX_AGE_DAYS", "7"))
+# Most recent debits a model is trained on
+TRAIN_ROWS = int(os.getenv("ANOMALY_TRAIN_ROWS", "100000"))
+
+
+def history_frame(transactions, user_id, limit=None, uploads=None):
+    """
+    Returns the user's most recent debits as a frame with the canonical
+    date/description/debit columns that fit_models expects. With `uploads`,
+    they are read from the columnar archive when it is complete.
+    """
+    columns = ["date", "description", "amount"]
+    df = transaction_archive.history(uploads, transactions, user_id, columns, debits=True) if uploads is not None else None
+    if df is not None:
+        df = df.sort_values("date", ascending=False, kind="stable").head(limit or TRAIN_ROWS)
+    else:
+        cursor = (
+            transactions.find({"user_id": user_id, "amount": {"$lt": 0}}, {"_id": 0, "date": 1, "description": 1, "amount": 1})
+            .sort("date", DESCENDING)
+            .limit(limit or TRAIN_ROWS)
+        )
+        df = pd.DataFrame(list(cursor), columns=columns)
+    return pd.DataFrame({
+        "date": pd.to_datetime(df["date"], errors="coerce"),
+        "description": df["description"],
+        "debit": -df["amount"].astype(float)
+    })
+
+
+def train(models, transactions, user_id, uploads=None):
+    """
+    Fits the user's models on their history and stores them. Returns the number
+    of debits trained on.
+    """
+    seen = (models.find_one({"_id": user_id}, {"new_since": 1}) or {}).get("new_since", 0)
+    frame = history_frame(transactions, user_id, uploads=uploads)
+    fitted = fit_models(frame)
+    models.update_one(
+        {"_id": user_id},
+        {
+            "$set": {"models": Binary(pickle.dumps(fitted)), "trained_at": datetime.utcnow(), "trained_on": len(frame)},
+            # Uploads that landed while training still count towards the next refresh
+            "$inc": {"new_since": -seen}
+        },
+        upsert=True
+    )
+    return len(frame)
+
+
+def load(models, user_id):
+    """
+    Returns the user's fitted models for analyze_anomalies, or None if none are stored yet.
+    """
+    doc = models.find_one({"_id": user_id}, {"models": 1})
+    if not doc or not doc.get("models"):
+        return None
+    return pickle.loads(doc["models"])
+
+
+def note_new_transactions(models, user_id, count):
+    """
+    Counts newly uploaded transactions and returns True when the user's models
+    are missing, stale or behind by RETRAIN_AFTER transactions.
+    """
+    doc = models.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {"new_since": count}},
+        projection={"trained_at": 1, "new_since": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    trained_at = doc.get("trained_at")
+    if trained_at is None:
+        return True
+    return doc["new_since"] >= RETRAIN_AFTER or datetime.utcnow() - trained_at > timedelta(days=MAX_AGE_DAYS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train per-user anomaly models from transaction history.")
+    parser.add_argument("--user", action="append", help="Only this user id (repeatable)")
+    args = parser.parse_args()
+
+    from database import db
+    user_ids = args.user or db["parsed_statements"].distinct("user_id")
+    for user_id in user_ids:
+        count = train(db["anomaly_models"], db["transactions"], user_id, uploads=db["parsed_statements"])
+        print(f"✅ Trained anomaly models for {user_id} on {count} debits")
@@ -1,72 +1,165 @@
 import pandas as pd
-from sklearn.ensemble import IsolationForest
+import numpy as np
 import re
-from datetime import datetime
+
+# Insights keep the statement-style keys the frontend reads.
+INSIGHT_COLUMNS = {'date': 'Value Date', 'description': 'Description', 'debit': 'Debit'}
+
+DAILY_FEATURES = ['num_transactions', 'total_debit']
+SINGLE_FEATURES = ['debit']
+# Below this many rows an IsolationForest says little; a robust z-score is used instead
+MIN_FIT_SAMPLES = 16
+ROBUST_Z_THRESHOLD = 3.5
+
+HANDLE_PATTERN = r'([\w]+@[A-Za-z0-9]+)'
+# cadence: (min, max) median days between charges and the fewest charges that count
+CADENCES = {
+    'weekly': (6, 8, 4),
+    'monthly': (27, 33, 3),
+    'quarterly': (85, 97, 3),
+    'annual': (355, 375, 2),
+}
+# Charges within this fraction (plus a rupee of slack) of each other count as one price
+SUBSCRIPTION_AMOUNT_DRIFT = 0.05
+SUBSCRIPTION_AMOUNT_SLACK = 1.0
 
 def extract_subscription_handle(desc):
-    match = re.search(r'([\w]+@[A-Za-z0-9]+)', str(desc))
+    match = re.search(HANDLE_PATTERN, str(desc))
     return match.group(1).lower() if match else str(desc).lower()
 
-def detect_hidden_subscriptions(df):
-    df['Value Date'] = pd.to_datetime(df['Value Date'], format='%d %b %Y', errors='coerce')
-    df['Debit'] = pd.to_numeric(df['Debit'], errors='coerce')
-    df['Subscription Handle'] = df['Description'].apply(extract_subscription_handle)
+def subscription_handles(descriptions):
+    """
+    Vectorized extract_subscription_handle over a Series of descriptions.
+    """
+    descriptions = descriptions.astype(str)
+    return descriptions.str.extract(HANDLE_PATTERN, expand=False).fillna(descriptions).str.lower()
 
-    subscriptions = []
-    groups = df.groupby(['Subscription Handle', 'Debit'])
-    for (handle, amount), group in groups:
-        if len(group) < 3:
-            continue
-        group_sorted = group.sort_values(by='Value Date')
-        gaps = group_sorted['Value Date'].diff().dropna().dt.days
-        if gaps.empty:
+def detect_hidden_subscriptions(frame):
+    """
+    Finds debits to the same handle that recur on a weekly, monthly, quarterly
+    or annual cadence in a canonical transaction frame (see transactions.py).
+    Amounts may drift by SUBSCRIPTION_AMOUNT_DRIFT between charges.
+    """
+    df = frame.loc[(frame['debit'] > 0) & frame['date'].notna(), ['date', 'description', 'debit']].drop_duplicates()
+    if df.empty:
+        return []
+    df['handle'] = subscription_handles(df['description'])
+
+    # Within a handle, sorted amounts start a new price cluster wherever they jump beyond the drift
+    df = df.sort_values(['handle', 'debit'])
+    previous = df['debit'].shift()
+    jump = df['debit'] - previous > previous * SUBSCRIPTION_AMOUNT_DRIFT + SUBSCRIPTION_AMOUNT_SLACK
+    df['cluster'] = ((df['handle'] != df['handle'].shift()) | jump).cumsum()
+
+    df = df.sort_values(['cluster', 'date'])
+    df['gap'] = df.groupby('cluster')['date'].diff().dt.days
+    stats = df.groupby('cluster').agg(
+        handle=('handle', 'first'),
+        occurrences=('debit', 'size'),
+        amount=('debit', 'median'),
+        low=('debit', 'min'),
+        high=('debit', 'max'),
+        period=('gap', 'median'),
+        last_seen=('date', 'max'),
+    )
+    # Small steps can chain; cap the whole cluster's spread too
+    steady = stats['high'] - stats['low'] <= 2 * stats['amount'] * SUBSCRIPTION_AMOUNT_DRIFT + SUBSCRIPTION_AMOUNT_SLACK
+    stats['cadence'] = None
+    for cadence, (low, high, min_occurrences) in CADENCES.items():
+        stats.loc[steady & stats['period'].between(low, high) & (stats['occurrences'] >= min_occurrences), 'cadence'] = cadence
+    found = stats[stats['cadence'].notna()]
+    if found.empty:
+        return []
+
+    charges = df[df['cluster'].isin(found.index)][['cluster', 'date', 'debit', 'description']].rename(columns=INSIGHT_COLUMNS)
+    by_cluster = {
+        cluster: group.drop(columns='cluster').to_dict(orient='records')
+        for cluster, group in charges.groupby('cluster')
+    }
+    return [{
+        'handle': row.handle,
+        'amount': round(float(row.amount), 2),
+        'cadence': row.cadence,
+        'period_days': float(row.period),
+        'next_expected': row.last_seen + pd.Timedelta(days=row.period),
+        'transactions': by_cluster[cluster]
+    } for cluster, row in found.iterrows()]
+
+def robust_outliers(features, threshold=ROBUST_Z_THRESHOLD):
+    """
+    Cheap stand-in for IsolationForest on inputs too small to fit: flags rows
+    whose modified z-score (median/MAD based) is unusually high in any column.
+    Returns 1/-1 like IsolationForest.predict.
+    """
+    flags = np.zeros(len(features), dtype=bool)
+    for col in features.columns:
+        values = features[col].to_numpy(dtype=float)
+        median = np.median(values)
+        mad = np.median(np.abs(values - median))
+        if mad == 0:
             continue
-        median_gap = gaps.median()
-        if 27 <= median_gap <= 33:
-            subscriptions.append({
-                'handle': handle,
-                'amount': float(amount),
-                'transactions': group_sorted[['Value Date', 'Debit', 'Description']].to_dict(orient='records')
-            })
-    return subscriptions
-
-def analyze_anomalies(df):
-    expected_cols = ['Value Date', 'Description', 'Ref', 'Debit', 'Credit', 'Balance']
-    if len(df.columns) == 6:
-        df.columns = expected_cols
-    elif len(df.columns) == 5:
-        df.columns = ['Value Date', 'Description', 'Debit', 'Credit', 'Balance']
-    else:
-        raise ValueError(f"Unexpected number of columns: {len(df.columns)}")
-
-    # df.columns = ['Value Date', 'Description', 'Ref', 'Debit', 'Credit', 'Balance']
-    df['Value Date'] = pd.to_datetime(df['Value Date'], errors='coerce')
-    df['Debit'] = pd.to_numeric(df['Debit'], errors='coerce')
-    df['Credit'] = pd.to_numeric(df['Credit'], errors='coerce')
+        flags |= 0.6745 * (values - median) / mad > threshold
+    return np.where(flags, -1, 1)
 
-    # Daily debit anomalies
-    debit_df = df[df['Debit'].notna()].copy()
-    daily_stats = debit_df.groupby(debit_df['Value Date'].dt.date).agg(
-        num_transactions=('Debit', 'count'),
-        total_debit=('Debit', 'sum'),
+def daily_debit_stats(debit_df):
+    return debit_df.groupby(debit_df['date'].dt.date).agg(
+        num_transactions=('debit', 'count'),
+        total_debit=('debit', 'sum'),
     ).reset_index()
 
-    iso = IsolationForest(contamination=0.08, random_state=42)
-    daily_features = daily_stats[['num_transactions', 'total_debit']]
-    daily_stats['anomaly'] = iso.fit_predict(daily_features)
+def fit_models(frame):
+    """
+    Fits the daily and single-transaction IsolationForests on a canonical frame,
+    using every core. A model is None when there is too little data to fit it.
+    """
+    # sklearn is only loaded by the processes that fit models
+    from sklearn.ensemble import IsolationForest
+
+    debit_df = frame[(frame['debit'] > 0) & frame['date'].notna()]
+    daily = daily_debit_stats(debit_df)
+
+    models = {'daily': None, 'single': None}
+    if len(daily) >= MIN_FIT_SAMPLES:
+        models['daily'] = IsolationForest(contamination=0.08, random_state=42, n_jobs=-1).fit(daily[DAILY_FEATURES])
+    if len(debit_df) >= MIN_FIT_SAMPLES:
+        models['single'] = IsolationForest(contamination=0.03, random_state=42, n_jobs=-1).fit(debit_df[SINGLE_FEATURES])
+    return models
+
+def _flag(model, features):
+    return model.predict(features) if model is not None else robust_outliers(features)
+
+def analyze_anomalies(frame, models=None, subscriptions=None):
+    """
+    Flags unusual debit days, high-value debits and hidden subscriptions in a
+    canonical transaction frame. The frame is not modified.
+
+    `models` are pre-fitted per-user models (see anomaly_models.py), so scoring
+    is a predict call; without them, models are fitted on this frame.
+    `subscriptions` are hidden subscriptions already found over the user's
+    history (see subscription_store.py); without them, this frame is searched.
+    """
+    debit_df = frame[(frame['debit'] > 0) & frame['date'].notna()].copy()
+    if debit_df.empty:
+        return {'daily_anomalies': [], 'high_value_anomalies': [], 'hidden_subscriptions': []}
+    if models is None:
+        models = fit_models(debit_df)
+
+    # Daily debit anomalies
+    daily_stats = daily_debit_stats(debit_df)
+    daily_stats['anomaly'] = _flag(models.get('daily'), daily_stats[DAILY_FEATURES])
+    daily_stats = daily_stats.rename(columns=INSIGHT_COLUMNS)
 
     daily_anomalies = daily_stats[daily_stats['anomaly'] == -1].to_dict(orient='records')
 
     # High-value transactions
-    iso_single = IsolationForest(contamination=0.03, random_state=42)
-    debit_df['single_txn_anomaly'] = iso_single.fit_predict(debit_df[['Debit']])
-    high_value_txns = debit_df[debit_df['single_txn_anomaly'] == -1][['Value Date', 'Description', 'Debit']]
-    high_value_anomalies = high_value_txns.to_dict(orient='records')
+    debit_df['single_txn_anomaly'] = _flag(models.get('single'), debit_df[SINGLE_FEATURES])
+    high_value_txns = debit_df[debit_df['single_txn_anomaly'] == -1][['date', 'description', 'debit']]
+    high_value_anomalies = high_value_txns.rename(columns=INSIGHT_COLUMNS).to_dict(orient='records')
 
-    hidden_subs = detect_hidden_subscriptions(df)
+    hidden_subs = detect_hidden_subscriptions(debit_df) if subscriptions is None else subscriptions
 
     return {
         'daily_anomalies': daily_anomalies,
         'high_value_anomalies': high_value_anomalies,
         'hidden_subscriptions': hidden_subs
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+from benchmarks import synthetic, stub_llm
+
+# Results file: {"meta": {...}, "results": {"<name>/<rows>": {name, rows, runs, median, min, rows_per_sec}}}
+# Runs are compared by key against a baseline file; a median slower than the
+# baseline by more than --tolerance is a regression.
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def record(results, name, rows, runs):
+    median = statistics.median(runs)
+    results[f"{name}/{rows}"] = {
+        "name": name,
+        "rows": rows,
+        "runs": [round(r, 4) for r in runs],
+        "median": round(median, 4),
+        "min": round(min(runs), 4),
+        "rows_per_sec": round(rows / median, 1) if median > 0 else None
+    }
+    print(f"⏱️ {name:<32} {rows:>9} rows  median {median:8.3f}s  {rows / median if median else 0:>12,.0f} rows/s")
+
+
+def bench_csv(results, workdir, sizes, repeat):
+    from csv_parser import parse_csv_frame, parse_csv_file
+    from anomaly_sub_api import analyze_anomalies, detect_hidden_subscriptions
+
+    for rows in sizes:
+        path = synthetic.write_csv(os.path.join(workdir, f"statement_{rows}.csv"), rows)
+        record(results, "parse_csv_file", rows, timed(lambda: parse_csv_file(path), repeat))
+
+        frame = parse_csv_frame(path)
+        record(results, "analyze_anomalies", rows, timed(lambda: analyze_anomalies(frame), repeat))
+        debits = frame[(frame["debit"] > 0) & frame["date"].notna()]
+        record(results, "detect_hidden_subscriptions", rows, timed(lambda: detect_hidden_subscriptions(debits), repeat))
+
+
+def bench_pdf(results, workdir, sizes, repeat):
+    from pdf_parser import parse_pdf_file
+    from pdf_layouts import LayoutRegistry
+
+    for rows in sizes:
+        for flavor, lined in (("lattice", True), ("stream", False)):
+            path = synthetic.write_pdf(os.path.join(workdir, f"statement_{rows}_{flavor}.pdf"), rows, lined=lined)
+            record(results, f"parse_pdf_file[{flavor}]", rows, timed(lambda: parse_pdf_file(path), repeat))
+
+            # Same statement once its layout template is known
+            layouts = LayoutRegistry()
+            parse_pdf_file(path, layouts=layouts)
+            record(results, f"parse_pdf_file[{flavor},template]", rows,
+                   timed(lambda: parse_pdf_file(path, layouts=layouts), repeat))
+
+
+def bench_api(results, workdir, sizes, repeat, llm_url):
+    """
+    Times POST /api/parse and the follow-up jobs against mongomock and the
+    stub LLM. Each run uploads a fresh statement as a new user, so nothing is
+    served from the upload cache or skipped as a duplicate.
+    """
+    import mongomock
+    import pymongo
+
+    os.environ.setdefault("mongo_username", "bench")
+    os.environ.setdefault("mongo_password", "bench")
+    os.environ["LLM_API_URL"] = os.environ["VISION_API_URL"] = llm_url
+    client = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *args, **kwargs: client
+
+    cwd = os.getcwd()
+    os.chdir(workdir)  # uploads/ is created next to the app
+    try:
+        import main
+        import worker
+        main.app.testing = True
+        api = main.app.test_client()
+
+        def drain(ctx, job_type):
+            while (job := main.job_queue.claim("bench", [job_type])) is not None:
+                worker.run_job(main.job_queue, ctx, job, "bench")
+
+        for rows in sizes:
+            timings = {"api_parse": [], "enrich_job": [], "train_anomaly_model_job": []}
+            for run in range(repeat):
+                path = synthetic.write_csv(os.path.join(workdir, f"upload_{rows}_{run}.csv"), rows, seed=run + 1)
+                main.db["category_cache"].delete_many({})
+                ctx = worker.build_context(main.db)
+
+                with open(path, "rb") as f:
+                    start = time.perf_counter()
+                    response = api.post("/api/parse", data={"file": (f, os.path.basename(path)), "user_id": f"bench-{rows}-{run}"},
+                                        content_type="multipart/form-data")
+                    timings["api_parse"].append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"/api/parse failed: {response.get_json()}")
+
+                for job_type in ("enrich", "train_anomaly_model"):
+                    start = time.perf_counter()
+                    drain(ctx, job_type)
+                    timings[f"{job_type}_job"].append(time.perf_counter() - start)
+
+            for name, runs in timings.items():
+                record(results, name, rows, runs)
+    finally:
+        os.chdir(cwd)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints each result against the baseline. Returns the keys that regressed.
+    """
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get("results", {}).get(key)
+        if not before or not before.get("median"):
+            continue
+        ratio = result["median"] / before["median"]
+        marker = "🔴" if ratio > 1 + tolerance else "🟢" if ratio < 1 - tolerance else "  "
+        print(f"{marker} {key:<44} {before['median']:8.3f}s -> {result['median']:8.3f}s  x{ratio:.2f}")
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+    return regressions
+
+
+def sizes(value):
+    return [int(float(v)) for v in value.split(",") if v.strip()] if value else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FinWizz ingestion path on synthetic statements.")
+    parser.add_argument("--csv-rows", type=sizes, default=sizes("1000,10000,100000,1000000"),
+                        help="CSV sizes for the parser, anomaly and subscription benchmarks")
+    parser.add_argument("--pdf-rows", type=sizes, default=sizes("200,1000"), help="PDF sizes (20 rows per page)")
+    parser.add_argument("--api-rows", type=sizes, default=sizes("1000,10000"), help="Sizes for the full /api/parse flow")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Seconds the stub LLM waits per reply")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a result counts as a regression")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finwizz-bench-")
+    results = {}
+    try:
+        bench_csv(results, workdir, args.csv_rows, args.repeat)
+        if args.pdf_rows:
+            bench_pdf(results, workdir, args.pdf_rows, args.repeat)
+        if args.api_rows:
+            server, llm_url = stub_llm.serve(delay=args.llm_delay)
+            try:
+                bench_api(results, workdir, args.api_rows, args.repeat, llm_url)
+            finally:
+                server.shutdown()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"🔴 {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
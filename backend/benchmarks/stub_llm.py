@@ -0,0 +1,64 @@
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# OpenAI-style chat endpoint standing in for the LLM and vision servers.
+# Batch prompts get one {"category", "note"} per numbered line, single prompts
+# one object, and image prompts a single transaction.
+ITEM_PATTERN = re.compile(r"^\d+\. ", re.M)
+IMAGE_REPLY = [{"date": "2024-03-02", "description": "UPI/stub@ybl", "amount": 120.0, "type": "debit", "balance": 1000.0}]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        content = body["messages"][0]["content"]
+        time.sleep(self.delay)
+
+        if isinstance(content, list):
+            reply = json.dumps(IMAGE_REPLY)
+        else:
+            count = len(ITEM_PATTERN.findall(content))
+            item = {"category": "Shopping", "note": "stub"}
+            reply = json.dumps([item] * count) if count else json.dumps(item)
+
+        data = json.dumps({"choices": [{"message": {"content": reply}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(port=0, delay=0.0):
+    """
+    Starts the stub in a daemon thread. Returns (server, chat completions URL).
+    """
+    handler = type("Handler", (StubHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a stub LLM/vision chat endpoint.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before each reply")
+    args = parser.parse_args()
+
+    server, url = serve(args.port, args.delay)
+    print(f"🤖 Stub LLM at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# Synthetic statements in the layout of sample/sample.csv: UPI transfer
+# descriptions, separate Debit/Credit columns and a running Balance. A few
+# merchants charge on a fixed cadence so subscription detection has work to do.
+CSV_COLUMNS = ["Value Date", "Description", "Ref No./Cheque No.", "Debit", "Credit", "Balance"]
+PDF_COLUMNS = ["Txn Date", "Narration", "Withdrawal", "Deposit", "Balance"]
+
+NAMES = ["ROHIT T", "MS SANJE", "SAGAR MO", "PRIYA K", "AMIT S", "NEHA R", "VIKRAM P", "ANITA P"]
+BANKS = ["HDFC", "KKBK", "SBIN", "ICIC", "UTIB", "YESB"]
+MERCHANTS = ["swiggy@okicici", "zomato@okhdfc", "amazon@apl", "flipkart@axl", "dmart@ybl", "uber@okaxis",
+             "ola@okicici", "myntra@ybl", "bigbasket@okhdfc"]
+PEOPLE = [f"{name}{i}@{psp}" for i, (name, psp) in enumerate(
+    [("anitapawar", "okhdfc"), ("spawar", "oksbi"), ("rohit", "okhdfc"), ("priya", "ybl"), ("amit", "okaxis")] * 60)]
+# (handle, amount, every n days)
+RECURRING = [("netflix@okicici", 649.0, 30), ("spotify@ybl", 119.0, 30), ("cultfit@okhdfc", 999.0, 7),
+             ("jiofiber@okaxis", 1178.82, 91)]
+
+
+def statement(rows, seed=0, start="2024-01-01"):
+    """
+    Returns a frame of `rows` transactions with the CSV_COLUMNS, oldest first.
+    """
+    rng = np.random.default_rng(seed)
+    # About 12 transactions a day, so a 1M-row statement spans a few hundred years of days
+    days = np.sort(rng.integers(0, max(rows // 12, 30), rows))
+    dates = pd.Timestamp(start) + pd.to_timedelta(days, unit="D")
+
+    is_debit = rng.random(rows) < 0.72
+    amounts = np.round(rng.lognormal(6.5, 1.1, rows), 2)
+    # Most transfers go to people, the rest to a handful of merchants
+    handles = np.where(rng.random(rows) < 0.4, np.array(MERCHANTS)[rng.integers(0, len(MERCHANTS), rows)],
+                       np.array(PEOPLE)[rng.integers(0, len(PEOPLE), rows)]).astype(object)
+
+    # Recurring charges replace ordinary debits on their due days
+    span = int(days[-1]) + 1 if rows else 0
+    for handle, amount, every in RECURRING:
+        due = np.searchsorted(days, np.arange(int(rng.integers(0, every)), span, every))
+        due = due[due < rows]
+        handles[due], amounts[due], is_debit[due] = handle, amount, True
+
+    names = np.array(NAMES)[rng.integers(0, len(NAMES), rows)]
+    banks = np.array(BANKS)[rng.integers(0, len(BANKS), rows)]
+    refs = rng.integers(10 ** 11, 10 ** 12, rows).astype(str)
+    prefix = np.where(is_debit, "TO TRANSFER-UPI/DR", "BY TRANSFER-UPI/CR")
+    descriptions = pd.Series(prefix).str.cat([refs, names, banks, handles.astype(str)], sep="/") + "/UPI--"
+
+    signed = np.where(is_debit, -amounts, amounts)
+    balance = np.round(50000 + np.cumsum(signed), 2)
+    phone = rng.integers(7 * 10 ** 9, 10 ** 10, rows).astype(str)
+    return pd.DataFrame({
+        "Value Date": dates.strftime("%d %b %Y"),
+        "Description": descriptions,
+        "Ref No./Cheque No.": np.where(is_debit, "TRANSFER TO ", "TRANSFER FROM ") + phone,
+        "Debit": np.where(is_debit, amounts, np.nan),
+        "Credit": np.where(is_debit, np.nan, amounts),
+        "Balance": balance,
+    })
+
+
+def write_csv(path, rows, seed=0):
+    statement(rows, seed).to_csv(path, index=False, float_format="%.2f")
+    return path
+
+
+def write_pdf(path, rows, seed=0, rows_per_page=20, lined=True):
+    """
+    Writes the same statement as a PDF table, one page per `rows_per_page`
+    rows, ruled (lattice) or plain (stream). Needs reportlab.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, PageBreak
+
+    frame = statement(rows, seed)
+    cells = pd.DataFrame({
+        "Txn Date": pd.to_datetime(frame["Value Date"], format="%d %b %Y").dt.strftime("%d/%m/%Y"),
+        # Long UPI strings are cut so a row fits on one line of the page
+        "Narration": frame["Description"].str.slice(0, 60),
+        "Withdrawal": frame["Debit"].map(lambda v: "" if pd.isna(v) else f"{v:.2f}"),
+        "Deposit": frame["Credit"].map(lambda v: "" if pd.isna(v) else f"{v:.2f}"),
+        "Balance": frame["Balance"].map(lambda v: f"{v:.2f}"),
+    }).values.tolist()
+
+    story = []
+    style = TableStyle([("GRID", (0, 0), (-1, -1), 0.5, colors.black)] if lined else [])
+    for start in range(0, len(cells), rows_per_page):
+        if story:
+            story.append(PageBreak())
+        table = Table([PDF_COLUMNS] + cells[start:start + rows_per_page])
+        table.setStyle(style)
+        story.append(table)
+    SimpleDocTemplate(path, pagesize=landscape(A4)).build(story)
+    return path
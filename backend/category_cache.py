@@ -0,0 +1,148 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+
+LRU_SIZE = int(os.getenv("CATEGORY_CACHE_LRU_SIZE", "5000"))
+TTL_DAYS = int(os.getenv("CATEGORY_CACHE_TTL_DAYS", "30"))
+MAX_ENTRIES = int(os.getenv("CATEGORY_CACHE_MAX_ENTRIES", "200000"))
+TRIM_EVERY = 500  # writes between size checks on the persistent tier
+
+HANDLE_RE = re.compile(r'([\w.\-]+@[A-Za-z0-9]+)')
+UPI_RE = re.compile(r'UPI/(CR|DR)/\d+/[^/]*/[^/]*/([^/]+)', re.IGNORECASE)
+
+
+def merchant_key(desc):
+    """
+    Normalizes a description to the merchant it pays or is paid by, e.g.
+    "TO TRANSFER-UPI/DR/4890.../SAGAR MO/KKBK/rohit@okhdfc/UPI--" -> "dr:rohit@okhdfc".
+    Reference numbers are dropped so repeat payments share one key.
+    """
+    desc = str(desc or "")
+    direction = ""
+    upi = UPI_RE.search(desc)
+    if upi:
+        direction = upi.group(1).lower() + ":"
+
+    handle = HANDLE_RE.search(desc)
+    if handle:
+        return direction + handle.group(1).lower()
+    if upi:
+        return direction + upi.group(2).strip().lower()
+
+    words = re.sub(r'\d+', ' ', desc.lower())
+    words = re.sub(r'[^a-z@]+', ' ', words).split()
+    return " ".join(words)
+
+
+def is_cacheable(result):
+    return bool(result) and result.get("category") not in (None, "Uncategorized")
+
+
+class CategoryCache:
+    """
+    Two-tier cache of merchant_key -> {"category", "note"}: an in-process LRU in
+    front of a Mongo collection with a TTL index and an entry cap.
+    """
+
+    def __init__(self, store=None, lru_size=LRU_SIZE, ttl_days=TTL_DAYS, max_entries=MAX_ENTRIES):
+        self.store = store
+        self.lru_size = lru_size
+        self.ttl = timedelta(days=ttl_days)
+        self.max_entries = max_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters = {"lru_hits": 0, "store_hits": 0, "misses": 0}
+
+    def ensure_indexes(self):
+        if self.store is not None:
+            self.store.create_index("updated_at", expireAfterSeconds=int(self.ttl.total_seconds()))
+
+    def _remember(self, key, value):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys):
+        """
+        Returns {key: result} for the keys found in either tier.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for key in set(keys):
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+                else:
+                    missing.append(key)
+            self.counters["lru_hits"] += len(found)
+
+        if missing and self.store is not None:
+            fresh_after = datetime.utcnow() - self.ttl
+            docs = self.store.find(
+                {"_id": {"$in": missing}, "updated_at": {"$gte": fresh_after}},
+                {"category": 1, "note": 1}
+            )
+            from_store = {doc["_id"]: {"category": doc["category"], "note": doc.get("note", "")} for doc in docs}
+            with self._lock:
+                for key, value in from_store.items():
+                    self._remember(key, value)
+                self.counters["store_hits"] += len(from_store)
+            found.update(from_store)
+
+        with self._lock:
+            self.counters["misses"] += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, results):
+        """
+        Stores {key: result}; fallback results are skipped.
+        """
+        results = {k: {"category": v["category"], "note": v.get("note", "")} for k, v in results.items() if is_cacheable(v)}
+        if not results:
+            return
+
+        with self._lock:
+            for key, value in results.items():
+                self._remember(key, value)
+            self._writes += len(results)
+            should_trim = self._writes >= TRIM_EVERY
+            if should_trim:
+                self._writes = 0
+
+        if self.store is None:
+            return
+        now = datetime.utcnow()
+        try:
+            self.store.bulk_write([
+                UpdateOne({"_id": key}, {"$set": {**value, "updated_at": now}}, upsert=True)
+                for key, value in results.items()
+            ], ordered=False)
+            if should_trim:
+                self.trim()
+        except Exception as e:
+            # The LRU tier still has the results; a failed write only costs a future LLM call
+            print(f"⚠️ Category cache write failed: {e}")
+
+    def trim(self):
+        """
+        Drops the least recently written entries beyond max_entries.
+        """
+        excess = self.store.count_documents({}) - self.max_entries
+        if excess <= 0:
+            return
+        oldest = self.store.find({}, {"_id": 1}).sort("updated_at", 1).limit(excess)
+        self.store.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}})
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["lru_entries"] = len(self._lru)
+        lookups = counters["lru_hits"] + counters["store_hits"] + counters["misses"]
+        counters["hit_rate"] = round((lookups - counters["misses"]) / lookups, 4) if lookups else None
+        return counters
@@ -0,0 +1,64 @@
+from datetime import datetime
+from pymongo import ASCENDING
+
+from category_cache import merchant_key
+
+# One document per user and merchant in the category_overrides collection:
+# {_id: "<user_id>:<merchant_key>", user_id, merchant, category, note, updated_at}
+# Written when a user recategorizes a merchant and asks for it to stick.
+# Enrichment applies them before rules, the cache and the LLM.
+
+
+def override_id(user_id, key):
+    return f"{user_id}:{key}"
+
+
+def ensure_indexes(overrides):
+    overrides.create_index([("user_id", ASCENDING), ("merchant", ASCENDING)])
+
+
+def remember(overrides, user_id, key, category, note=""):
+    overrides.update_one(
+        {"_id": override_id(user_id, key)},
+        {"$set": {"user_id": user_id, "merchant": key, "category": category, "note": note,
+                  "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def forget(overrides, user_id, key):
+    return overrides.delete_one({"_id": override_id(user_id, key)}).deleted_count > 0
+
+
+def lookup(overrides, user_id, keys):
+    """
+    Returns {merchant_key: {"category", "note"}} for the user's overrides among `keys`.
+    """
+    ids = [override_id(user_id, key) for key in set(keys)]
+    if not ids:
+        return {}
+    return {
+        doc["merchant"]: {"category": doc["category"], "note": doc.get("note", "")}
+        for doc in overrides.find({"_id": {"$in": ids}}, {"merchant": 1, "category": 1, "note": 1})
+    }
+
+
+def apply(overrides, user_id, records):
+    """
+    Sets category and note on the records whose merchant the user has an
+    override for. Returns the number of records changed.
+    """
+    keys = [merchant_key(record.get("description", "")) for record in records]
+    chosen = lookup(overrides, user_id, keys)
+    for record, key in zip(records, keys):
+        if key in chosen:
+            record.update(chosen[key])
+    return sum(1 for key in keys if key in chosen)
+
+
+def user_overrides(overrides, user_id):
+    return [
+        {"merchant": doc["merchant"], "category": doc["category"], "note": doc.get("note", ""),
+         "updated_at": doc.get("updated_at")}
+        for doc in overrides.find({"user_id": user_id}).sort("merchant", ASCENDING)
+    ]
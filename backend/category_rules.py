@@ -0,0 +1,99 @@
+import os
+import re
+import json
+import threading
+
+RULES_PATH = os.getenv("CATEGORY_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "category_rules.json"))
+
+
+def trie_pattern(words):
+    """
+    Compiles literal words into one regex shaped like a trie, so shared prefixes
+    ("ola", "olacabs") are tested once instead of once per word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if end else body
+
+    return build(trie)
+
+
+class RuleMatcher:
+    """
+    Deterministic pre-classifier over vendor keywords and UPI handle suffixes,
+    loaded from a JSON rule file. Edits to the file are picked up on the next
+    call; reload() forces it.
+    """
+
+    def __init__(self, path=RULES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.counters = {"resolved": 0, "seen": 0}
+        self.reload()
+
+    def reload(self):
+        with open(self.path, encoding="utf-8") as f:
+            rules = json.load(f)
+
+        keywords = {kw.lower(): cat for cat, kws in rules.get("keywords", {}).items() for kw in kws}
+        suffixes = {s.lower().lstrip("@"): cat for cat, sfx in rules.get("handle_suffixes", {}).items() for s in sfx}
+
+        # Trie branches are greedy, so "olacabs" wins over "ola" at the same position
+        keyword_re = re.compile(r"(?<![a-z0-9])(" + trie_pattern(keywords) + r")(?![a-z0-9])") if keywords else None
+        suffix_re = re.compile(r"@(" + trie_pattern(suffixes) + r")(?![a-z0-9])") if suffixes else None
+
+        with self._lock:
+            self._keywords, self._suffixes = keywords, suffixes
+            self._keyword_re, self._suffix_re = keyword_re, suffix_re
+            self._mtime = os.path.getmtime(self.path)
+        return len(keywords) + len(suffixes)
+
+    def _reload_if_changed(self):
+        try:
+            if os.path.getmtime(self.path) != self._mtime:
+                self.reload()
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Keeping previous category rules: {e}")
+
+    def classify(self, desc):
+        text = str(desc or "").lower()
+        if self._suffix_re is not None:
+            m = self._suffix_re.search(text)
+            if m:
+                return {"category": self._suffixes[m.group(1)], "note": f"Rule: handle @{m.group(1)}"}
+        if self._keyword_re is not None:
+            m = self._keyword_re.search(text)
+            if m:
+                return {"category": self._keywords[m.group(1)], "note": f"Rule: matched '{m.group(1)}'"}
+        return None
+
+    def classify_many(self, descriptions):
+        """
+        Returns one result per description, None where no rule applies.
+        """
+        self._reload_if_changed()
+        with self._lock:
+            results = [self.classify(desc) for desc in descriptions]
+            resolved = sum(1 for r in results if r is not None)
+            self.counters["resolved"] += resolved
+            self.counters["seen"] += len(results)
+        return results
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["rules"] = len(self._keywords) + len(self._suffixes)
+        counters["resolved_fraction"] = round(counters["resolved"] / counters["seen"], 4) if counters["seen"] else None
+        return counters
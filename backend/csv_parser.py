@@ -1,14 +1,77 @@
 import pandas as pd
+import numpy as np
 import json
 from dateutil import parser as dateparser
 import os
+from transactions import build_frame, frame_to_records, records_to_frame
 
-def parse_csv_file(csv_path: str) -> list:
+# Day-first layouts seen in Indian bank exports. Year-first layouts are left out on
+# purpose: dateutil applies dayfirst to them per value, so no single format matches it.
+DATE_FORMATS = [
+    "%d %b %Y",
+    "%d-%b-%Y",
+    "%d/%b/%Y",
+    "%d %B %Y",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d-%m-%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d-%m-%Y %H:%M",
+]
+DATE_SAMPLE_SIZE = 50
+
+
+def infer_date_format(values: pd.Series):
     """
-    Reads and parses a bank statement CSV file into normalized transaction records.
-    Returns a list of JSON-ready dictionaries.
+    Picks the first entry of DATE_FORMATS that parses a sample of `values`
+    to exactly what dateutil (dayfirst) would return. Returns None if none fit.
     """
+    sample = values.head(DATE_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+
+    expected = []
+    for value in sample:
+        try:
+            expected.append(dateparser.parse(value, dayfirst=True))
+        except (ValueError, OverflowError):
+            return None
 
+    for fmt in DATE_FORMATS:
+        parsed = pd.to_datetime(sample, format=fmt, errors="coerce")
+        if parsed.isna().any():
+            continue
+        if all(p.to_pydatetime() == e for p, e in zip(parsed, expected)):
+            return fmt
+    return None
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """
+    Parses date strings with one inferred format, falling back to dateutil
+    only for the rows that don't match it.
+    """
+    values = values.astype(str)
+    fmt = infer_date_format(values)
+    if fmt is None:
+        return values.apply(lambda x: dateparser.parse(x, dayfirst=True))
+
+    parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+    misses = parsed.isna()
+    if not misses.any():
+        return parsed
+
+    parsed = parsed.astype(object)
+    parsed[misses] = values[misses].apply(lambda x: dateparser.parse(x, dayfirst=True))
+    try:
+        return pd.to_datetime(parsed)
+    except (TypeError, ValueError):
+        return parsed  # mixed timezones stay as objects
+
+
+def _read_statement(csv_path: str):
     if not os.path.isfile(csv_path):
         raise FileNotFoundError("CSV file not found.")
 
@@ -21,17 +84,24 @@ def parse_csv_file(csv_path: str) -> list:
     df.columns = [col.lower().strip() for col in df.columns]
 
     # Guess relevant columns
-    date_col    = next((c for c in df.columns if 'txn' in c or 'date' in c), None)
-    desc_col    = next((c for c in df.columns if 'desc' in c), None)
-    debit_col   = next((c for c in df.columns if 'debit' in c), None)
-    credit_col  = next((c for c in df.columns if 'credit' in c), None)
-    balance_col = next((c for c in df.columns if 'balance' in c), None)
+    cols = {
+        "date":    next((c for c in df.columns if 'txn' in c or 'date' in c), None),
+        "desc":    next((c for c in df.columns if 'desc' in c), None),
+        "debit":   next((c for c in df.columns if 'debit' in c), None),
+        "credit":  next((c for c in df.columns if 'credit' in c), None),
+        "balance": next((c for c in df.columns if 'balance' in c), None),
+    }
 
-    if not date_col or not desc_col:
+    if not cols["date"] or not cols["desc"]:
         raise ValueError("Required columns like 'Txn Date' or 'Description' not found.")
 
-    # Clean & parse data
-    df = df.dropna(subset=[date_col, desc_col])
+    return df.dropna(subset=[cols["date"], cols["desc"]]), cols
+
+
+def _parse_rowwise(df: pd.DataFrame, cols: dict) -> list:
+    date_col, desc_col = cols["date"], cols["desc"]
+    debit_col, credit_col, balance_col = cols["debit"], cols["credit"], cols["balance"]
+
     df['date'] = df[date_col].apply(lambda x: dateparser.parse(str(x), dayfirst=True))
     df['description'] = df[desc_col].astype(str).str.replace(r'\s+', ' ', regex=True).str.strip()
     df['debit'] = pd.to_numeric(df[debit_col], errors='coerce').fillna(0) if debit_col else 0
@@ -55,4 +125,45 @@ def parse_csv_file(csv_path: str) -> list:
             entry["balance"] = float(row["balance"])
         records.append(entry)
 
-    return records
\ No newline at end of file
+    return records
+
+
+def _build_frame(df: pd.DataFrame, cols: dict) -> pd.DataFrame:
+    debit_col, credit_col, balance_col = cols["debit"], cols["credit"], cols["balance"]
+    n = len(df)
+
+    return build_frame(
+        parse_dates(df[cols["date"]]),
+        df[cols["desc"]].astype(str).str.replace(r'\s+', ' ', regex=True).str.strip(),
+        pd.to_numeric(df[debit_col], errors='coerce').fillna(0).to_numpy() if debit_col else np.zeros(n),
+        pd.to_numeric(df[credit_col], errors='coerce').fillna(0).to_numpy() if credit_col else np.zeros(n),
+        pd.to_numeric(df[balance_col], errors='coerce').to_numpy(dtype=float) if balance_col else None,
+    )
+
+
+def parse_csv_frame(csv_path: str, engine: str = "vectorized") -> pd.DataFrame:
+    """
+    Reads a bank statement CSV into the canonical transaction frame (see transactions.py).
+    """
+    if engine == "python":
+        return records_to_frame(parse_csv_file(csv_path, engine="python"))
+
+    df, cols = _read_statement(csv_path)
+    return _build_frame(df, cols)
+
+
+def parse_csv_file(csv_path: str, engine: str = "vectorized") -> list:
+    """
+    Reads and parses a bank statement CSV file into normalized transaction records.
+    Returns a list of JSON-ready dictionaries.
+
+    `engine="vectorized"` infers the date format once per file and computes
+    columns in bulk; `engine="python"` is the original per-row path.
+    """
+    df, cols = _read_statement(csv_path)
+
+    if engine == "python":
+        return _parse_rowwise(df, cols)
+    if engine == "vectorized":
+        return frame_to_records(_build_frame(df, cols))
+    raise ValueError(f"Unknown CSV engine: {engine}")
@@ -0,0 +1,226 @@
+import os
+import time
+import random
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from http_client import CircuitOpen, is_outage
+import metrics
+from category_cache import merchant_key
+import category_overrides
+from rollups import move_categories
+from transaction_store import upload_chunk, set_categories
+from llm_utils import request_batch, categorize_transaction, BatchSizeMismatch, FALLBACK_RESULT
+
+BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "25"))
+CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("ENRICH_MAX_RETRIES", "3"))
+BACKOFF_SECONDS = float(os.getenv("ENRICH_BACKOFF_SECONDS", "0.5"))
+CHUNK_SIZE = int(os.getenv("ENRICH_CHUNK_SIZE", "500"))
+
+
+def classify_batch(descriptions):
+    """
+    Classifies one batch, retrying with exponential backoff on errors and
+    splitting the batch in half when the model returns the wrong item count or
+    keeps failing (e.g. a 400 for a batch too long for the model's context).
+    Rows that can't be classified get FALLBACK_RESULT. Outages (see
+    http_client.is_outage), already retried by the LLM client, are raised
+    instead: the job is retried from its checkpoint rather than storing
+    fallbacks for an outage.
+    """
+    if not descriptions:
+        return []
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            with metrics.stage("enrich_batch"):
+                return request_batch(descriptions)
+        except BatchSizeMismatch as e:
+            if len(descriptions) == 1:
+                return [categorize_transaction(descriptions[0])]
+            print(f"✂️ Splitting batch of {len(descriptions)}: {e}")
+            return _split(descriptions)
+        except Exception as e:
+            if is_outage(e):
+                raise
+            delay = BACKOFF_SECONDS * (2 ** attempt) * (1 + random.random())
+            print(f"🔁 Batch of {len(descriptions)} failed (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
+            if attempt + 1 < MAX_RETRIES:
+                time.sleep(delay)
+
+    if len(descriptions) > 1:
+        print(f"✂️ Splitting batch of {len(descriptions)} after {MAX_RETRIES} failed attempts")
+        return _split(descriptions)
+    return [dict(FALLBACK_RESULT) for _ in descriptions]
+
+
+def _split(descriptions):
+    mid = len(descriptions) // 2
+    return classify_batch(descriptions[:mid]) + classify_batch(descriptions[mid:])
+
+
+def iter_enriched(descriptions, batch_size=None, concurrency=None):
+    """
+    Yields (offset, results) per batch, in statement order, while up to
+    `concurrency` batches are in flight against the LLM.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    concurrency = concurrency or CONCURRENCY
+    offsets = range(0, len(descriptions), batch_size)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool, metrics.pending("enrich_batches", len(offsets)):
+        batches = pool.map(classify_batch, (descriptions[i:i + batch_size] for i in offsets))
+        for offset, results in zip(offsets, batches):
+            yield offset, results
+
+
+def _classify_with_cache(descriptions, batch_size, concurrency, cache):
+    """
+    Returns (results, cached_count). Cached merchants skip the LLM and each
+    uncached merchant is sent once.
+    """
+    if cache is None:
+        results = []
+        for _, batch in iter_enriched(descriptions, batch_size, concurrency):
+            results.extend(batch)
+        return results, 0
+
+    keys = [merchant_key(desc) for desc in descriptions]
+    known = cache.get_many(keys)
+    pending = {}
+    for key, desc in zip(keys, descriptions):
+        if key not in known and key not in pending:
+            pending[key] = desc
+
+    pending_keys = list(pending)
+    fresh = {}
+    for offset, batch in iter_enriched(list(pending.values()), batch_size, concurrency):
+        fresh.update(zip(pending_keys[offset:offset + len(batch)], batch))
+    cache.put_many(fresh)
+
+    known.update(fresh)
+    results = [dict(known[key]) for key in keys]
+    return results, sum(1 for key in keys if key not in fresh)
+
+
+def enrich_descriptions(descriptions, batch_size=None, concurrency=None, cache=None, rules=None):
+    """
+    Categorizes every description: a RuleMatcher resolves what it can, then a
+    CategoryCache, then the LLM handles the rest.
+    Returns (results, stats) where stats reports count, rule and cache hits,
+    seconds and throughput in transactions per second.
+    """
+    start = time.perf_counter()
+
+    results = rules.classify_many(descriptions) if rules is not None else [None] * len(descriptions)
+    leftover = [i for i, result in enumerate(results) if result is None]
+    llm_results, cached_count = _classify_with_cache([descriptions[i] for i in leftover], batch_size, concurrency, cache)
+    for i, result in zip(leftover, llm_results):
+        results[i] = result
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "count": len(results),
+        "rule_resolved": len(results) - len(leftover),
+        "cached": cached_count,
+        "seconds": round(elapsed, 3),
+        "txn_per_sec": round(len(results) / elapsed, 2) if elapsed > 0 else None
+    }
+    return results, stats
+
+
+def enrich_records(txns, batch_size=None, concurrency=None, cache=None, rules=None):
+    """
+    Returns (enriched_txns, stats) with each transaction merged with its
+    {"category", "note"} result.
+    """
+    descriptions = [txn.get("description", "") for txn in txns]
+    results, stats = enrich_descriptions(descriptions, batch_size, concurrency, cache, rules)
+    return [{**txn, **result} for txn, result in zip(txns, results)], stats
+
+
+def enrich_upload(collection, transactions, upload_id, cache=None, rules=None, chunk_size=None, force=False, rollups=None,
+                  overrides=None):
+    """
+    Enriches one upload chunk by chunk, reading its rows from the transactions
+    collection in serial order. Each chunk is saved with one bulk_write and then
+    an `enrichment.position` checkpoint (the last saved serial) on the upload, so
+    readers see progress and a restarted worker resumes where the last one stopped.
+    Rows that already have a category are skipped unless `force` is set.
+    With `rollups`, the user's per-category totals follow each saved chunk.
+    With `overrides`, merchants the user recategorized keep the user's choice
+    and skip rules, cache and LLM; the upload is then marked `enrichment.overridden`.
+    Returns stats, or None when the upload doesn't exist.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    _id = ObjectId(upload_id)
+    doc = collection.find_one({"_id": _id}, {"count": 1, "enrichment": 1, "user_id": 1})
+    if not doc:
+        return None
+
+    total = doc.get("count", 0)
+    position = 0 if force else doc.get("enrichment", {}).get("position", 0)
+    started = {
+        "enrichment.status": "running",
+        "enrichment.total": total,
+        "enrichment.position": position,
+        "enrichment.updated_at": datetime.utcnow()
+    }
+    if force:
+        started["enrichment.overridden"] = False
+    collection.update_one({"_id": _id}, {"$set": started})
+
+    totals = {"count": 0, "rule_resolved": 0, "cached": 0, "overridden": 0}
+    start = time.perf_counter()
+    try:
+        while True:
+            chunk = upload_chunk(transactions, upload_id, position, chunk_size)
+            if not chunk:
+                break
+
+            todo = [txn for txn in chunk if force or "category" not in txn]
+            keys = [merchant_key(txn.get("description", "")) for txn in todo]
+            # Looked up per chunk, so an override saved mid-upload applies to the rest
+            chosen = category_overrides.lookup(overrides, doc.get("user_id"), keys) if overrides is not None else {}
+            rest = [txn for txn, key in zip(todo, keys) if key not in chosen]
+            rest_results, stats = enrich_descriptions(
+                [txn.get("description", "") for txn in rest], cache=cache, rules=rules
+            )
+            rest_results = iter(rest_results)
+            results = [chosen[key] if key in chosen else next(rest_results) for key in keys]
+            stats["overridden"] = len(todo) - len(rest)
+            stats["count"] += stats["overridden"]
+            set_categories(transactions, [
+                (txn["_id"], {"category": result["category"], "note": result.get("note", "")})
+                for txn, result in zip(todo, results)
+            ])
+
+            position = chunk[-1]["serial"]
+            checkpoint = {"enrichment.position": position, "enrichment.updated_at": datetime.utcnow()}
+            if stats["overridden"]:
+                # The user's own categories must not be shared through the upload cache
+                checkpoint["enrichment.overridden"] = True
+            collection.update_one({"_id": _id}, {"$set": checkpoint})
+            if rollups is not None:
+                move_categories(rollups, doc.get("user_id"), [
+                    (txn.get("amount", 0), txn.get("category"), result["category"])
+                    for txn, result in zip(todo, results)
+                ])
+
+            for key in totals:
+                totals[key] += stats[key]
+            print(f"✅ Enriched {position}/{total} for {upload_id}")
+    except CircuitOpen:
+        # Nothing was lost: the job resumes from `position` once the LLM is back
+        collection.update_one({"_id": _id}, {"$set": {"enrichment.status": "pending"}})
+        raise
+    except Exception:
+        collection.update_one({"_id": _id}, {"$set": {"enrichment.status": "failed"}})
+        raise
+
+    collection.update_one({"_id": _id}, {"$set": {"enrichment.status": "done"}})
+    elapsed = time.perf_counter() - start
+    totals["seconds"] = round(elapsed, 3)
+    totals["txn_per_sec"] = round(totals["count"] / elapsed, 2) if elapsed > 0 else None
+    return totals
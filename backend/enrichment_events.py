@@ -0,0 +1,183 @@
+import os
+import json
+import queue
+import threading
+from bson import ObjectId
+
+from jobs import QUEUED, RUNNING
+import metrics
+
+# Server-Sent Events for an upload's enrichment. Workers only write progress to
+# MongoDB (`enrichment.position` after each saved chunk), so each API process
+# runs one ProgressHub that polls the watched uploads and fans events out:
+#   progress  {status, position, total}       when any of them changes
+#   batch     {position, transactions: [...]} rows categorized since the client's last event
+#   done / failed / error                     then the stream ends
+# Event ids are the last serial sent, so a reconnecting EventSource resumes
+# through Last-Event-ID.
+POLL_SECONDS = float(os.getenv("SSE_POLL_SECONDS", "0.5"))
+KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+MAX_LISTENERS = int(os.getenv("SSE_MAX_LISTENERS", "1000"))
+BATCH_ROWS = 500  # transactions per batch event
+
+BATCH_FIELDS = {"_id": 0, "serial": 1, "date": 1, "description": 1, "amount": 1, "category": 1, "note": 1}
+
+
+class HubFull(Exception):
+    """Raised by subscribe when MAX_LISTENERS clients are already connected."""
+
+
+def format_event(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, default=str)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+class Listener:
+    """
+    One connected client. Iterating yields SSE text until the upload finishes;
+    closing the iterator (the client went away) unsubscribes it.
+    """
+
+    def __init__(self, hub, upload_id, after=0):
+        self.hub = hub
+        self.upload_id = upload_id
+        self.sent = after  # last serial delivered
+        self.last_progress = None
+        self.events = queue.Queue()
+
+    def push(self, text):
+        self.events.put(text)
+
+    def __iter__(self):
+        try:
+            while True:
+                try:
+                    text = self.events.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Comment line: keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                if text is None:
+                    return
+                yield text
+        finally:
+            self.hub.unsubscribe(self)
+
+
+class ProgressHub:
+    """
+    Polls the uploads that have listeners with one query per tick, however many
+    clients are connected, and reads each newly saved chunk once for all the
+    listeners at the same position. Clients only wait on their own queue, so
+    under a gevent server a listener costs a greenlet rather than a thread.
+    """
+
+    def __init__(self, collection, transactions, jobs, poll_seconds=POLL_SECONDS, max_listeners=MAX_LISTENERS):
+        self.collection = collection
+        self.transactions = transactions
+        self.jobs = jobs
+        self.poll_seconds = poll_seconds
+        self.max_listeners = max_listeners
+        self._watched = {}  # upload_id -> set of Listeners
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        metrics.sse_listeners.collect_with(lambda: [({}, self.listener_count())], key="enrichment_events")
+
+    def listener_count(self):
+        with self._lock:
+            return sum(len(listeners) for listeners in self._watched.values())
+
+    def subscribe(self, upload_id, after=0):
+        with self._lock:
+            if sum(len(listeners) for listeners in self._watched.values()) >= self.max_listeners:
+                raise HubFull(f"{self.max_listeners} listeners already connected")
+            listener = Listener(self, upload_id, after)
+            self._watched.setdefault(upload_id, set()).add(listener)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="enrichment-events", daemon=True)
+                self._thread.start()
+        self._wake.set()  # first snapshot right away
+        return listener
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            listeners = self._watched.get(listener.upload_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._watched[listener.upload_id]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                watched = {upload_id: set(listeners) for upload_id, listeners in self._watched.items()}
+            if watched:
+                try:
+                    self.tick(watched)
+                except Exception as e:
+                    print(f"⚠️ Enrichment progress poll failed: {e}")
+            self._wake.wait(self.poll_seconds if watched else None)
+            self._wake.clear()
+
+    def tick(self, watched):
+        docs = self.collection.find(
+            {"_id": {"$in": [ObjectId(upload_id) for upload_id in watched]}},
+            {"count": 1, "enrichment": 1}
+        )
+        by_id = {str(doc["_id"]): doc for doc in docs}
+
+        for upload_id, listeners in watched.items():
+            doc = by_id.get(upload_id)
+            if doc is None:
+                self._finish(upload_id, listeners, format_event("error", {"error": "Upload not found"}))
+                continue
+
+            enrichment = doc.get("enrichment", {})
+            progress = {
+                "status": enrichment.get("status", "pending"),
+                "position": enrichment.get("position", 0),
+                "total": enrichment.get("total", doc.get("count", 0))
+            }
+            self._send_batches(upload_id, listeners, progress["position"])
+
+            event = format_event("progress", progress, progress["position"])
+            for listener in listeners:
+                if listener.last_progress != progress:
+                    listener.last_progress = progress
+                    listener.push(event)
+
+            if progress["status"] == "done":
+                self._finish(upload_id, listeners, format_event("done", progress, progress["position"]))
+            elif progress["status"] == "failed" and not self._retrying(upload_id):
+                self._finish(upload_id, listeners, format_event("failed", progress, progress["position"]))
+
+    def _send_batches(self, upload_id, listeners, position):
+        # Listeners that joined at the same point share one read
+        for after in {listener.sent for listener in listeners if listener.sent < position}:
+            rows = list(
+                self.transactions.find({"upload_id": upload_id, "serial": {"$gt": after, "$lte": position}}, BATCH_FIELDS)
+                .sort("serial", 1)
+            )
+            events = [
+                format_event("batch", {"position": part[-1]["serial"], "transactions": part}, part[-1]["serial"])
+                for part in (rows[start:start + BATCH_ROWS] for start in range(0, len(rows), BATCH_ROWS))
+            ]
+            for listener in listeners:
+                if listener.sent == after:
+                    for event in events:
+                        listener.push(event)
+                    listener.sent = position
+
+    def _retrying(self, upload_id):
+        # A failed attempt with retries left goes back to the queue
+        return self.jobs.count_documents(
+            {"dedupe_key": f"enrich:{upload_id}", "status": {"$in": [QUEUED, RUNNING]}}, limit=1
+        ) > 0
+
+    def _finish(self, upload_id, listeners, event):
+        for listener in listeners:
+            listener.push(event)
+            listener.push(None)
+            self.unsubscribe(listener)
@@ -0,0 +1,207 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Responses worth another attempt: the server is overloaded or briefly unavailable
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitOpen(RuntimeError):
+    """Raised without sending anything while a backend's circuit breaker is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} backend is unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def is_outage(error):
+    """
+    True for errors that mean the backend is unavailable, as opposed to a bad
+    request or a malformed reply: CircuitOpen, connection errors, timeouts and
+    the 429/5xx replies left over after retries.
+    """
+    if isinstance(error, CircuitOpen):
+        return True
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUSES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class Backend:
+    """
+    Shared HTTP client for one model server. Connections are pooled and kept
+    alive, at most `concurrency` requests are in flight per process, transport
+    errors and 429/5xx replies are retried with jittered exponential backoff,
+    and after `failure_threshold` consecutive failed calls a circuit breaker
+    rejects calls for `reset_seconds` before letting one trial call through.
+    """
+
+    def __init__(self, name, url, concurrency=4, timeout=30, retries=2, backoff=0.5,
+                 failure_threshold=5, reset_seconds=30, headers=None):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self.counters = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+        metrics.backend_circuit_open.collect_with(lambda: [({"backend": self.name}, int(self.state() != CLOSED))], key=name)
+
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return CLOSED
+            if self._trial or time.monotonic() - self._opened_at >= self.reset_seconds:
+                return HALF_OPEN
+            return OPEN
+
+    def _admit(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0 or self._trial:
+                self.counters["rejected"] += 1
+                metrics.backend_events.inc(backend=self.name, event="rejected")
+                raise CircuitOpen(self.name, max(remaining, 1))
+            # Half-open: this call decides whether the breaker closes again
+            self._trial = True
+
+    def _record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            self.counters["failures"] += 1
+            metrics.backend_events.inc(backend=self.name, event="failure")
+            if self._failures >= self.failure_threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+    def _send(self, payload, timeout):
+        with self._slots:
+            with self._lock:
+                self.counters["requests"] += 1
+            metrics.backend_in_flight.inc(backend=self.name)
+            try:
+                return self.session.post(self.url, json=payload, timeout=(CONNECT_TIMEOUT, timeout))
+            finally:
+                metrics.backend_in_flight.inc(-1, backend=self.name)
+
+    def post_json(self, payload, timeout=None, retries=None):
+        """
+        POSTs `payload` and returns the decoded JSON reply. Raises CircuitOpen
+        while the breaker is open, requests.HTTPError for other 4xx replies, and
+        the last error once retries are used up.
+        """
+        self._admit()
+        timeout = timeout or self.timeout
+        retries = self.retries if retries is None else retries
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            reply = self._post_with_retries(payload, timeout, retries)
+            outcome = "ok"
+            return reply
+        finally:
+            metrics.backend_seconds.observe(time.perf_counter() - start, backend=self.name, outcome=outcome)
+
+    def _post_with_retries(self, payload, timeout, retries):
+        recorded = False
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    response = self._send(payload, timeout)
+                except requests.RequestException as e:
+                    # Connection, timeout, and broken or undecodable replies alike
+                    error = e
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        # The server answered; a 4xx is the request's fault, not an outage
+                        recorded = True
+                        self._record(True)
+                        response.raise_for_status()
+                        return response.json()
+                    error = requests.HTTPError(f"{response.status_code} from {self.name} backend", response=response)
+
+                if attempt < retries:
+                    with self._lock:
+                        self.counters["retries"] += 1
+                    metrics.backend_events.inc(backend=self.name, event="retry")
+                    time.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+
+            recorded = True
+            self._record(False)
+            raise error
+        except BaseException:
+            # Anything else still settles a half-open trial, or the breaker would stay stuck
+            if not recorded:
+                self._record(False)
+            raise
+
+    async def apost_json(self, payload, timeout=None, retries=None):
+        """
+        post_json for asyncio callers. Runs on the same pooled session, so the
+        concurrency limit and breaker are shared with threaded callers.
+        """
+        return await asyncio.to_thread(self.post_json, payload, timeout, retries)
+
+    async def gather(self, payloads, timeout=None, retries=None):
+        """
+        Sends all payloads concurrently, within the backend's limit. Returns a
+        reply or the raised exception per payload, in order.
+        """
+        return await asyncio.gather(
+            *(self.apost_json(payload, timeout, retries) for payload in payloads),
+            return_exceptions=True
+        )
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["consecutive_failures"] = self._failures
+        counters["state"] = self.state()
+        return counters
+
+
+def from_env(name, url, headers=None, concurrency=4, timeout=30):
+    """
+    Builds a Backend tuned by <NAME>_CONCURRENCY, <NAME>_TIMEOUT, <NAME>_RETRIES,
+    <NAME>_BREAKER_FAILURES and <NAME>_BREAKER_RESET_SECONDS.
+    """
+    prefix = name.upper()
+    return Backend(
+        name, url,
+        concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))),
+        retries=int(os.getenv(f"{prefix}_RETRIES", "2")),
+        backoff=float(os.getenv(f"{prefix}_BACKOFF_SECONDS", "0.5")),
+        failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", "5")),
+        reset_seconds=float(os.getenv(f"{prefix}_BREAKER_RESET_SECONDS", "30")),
+        headers=headers
+    )
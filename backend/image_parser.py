@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import base64
+from io import BytesIO
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from transactions import records_to_frame
+import http_client
+import metrics
+
+TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
+# Any OpenAI-style chat endpoint with image input, e.g. a local stub in tests
+VISION_API_URL = os.getenv("VISION_API_URL", "https://api.together.xyz/v1/chat/completions")
+VISION_MODEL = os.getenv("VISION_MODEL", "meta-llama/Llama-3.2-11B-Vision-Instruct-Turbo")
+VISION_TIMEOUT = int(os.getenv("VISION_TIMEOUT", "60"))
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "4"))
+
+# Pooled client shared by every tile request (see http_client.py for VISION_RETRIES etc.)
+vision = http_client.from_env(
+    "vision", VISION_API_URL, headers={"Authorization": f"Bearer {TOGETHER_API_KEY}"},
+    concurrency=VISION_CONCURRENCY, timeout=VISION_TIMEOUT
+)
+
+# Images are downscaled to MAX_WIDTH and re-encoded as JPEG before upload.
+# Taller ones are cut into TILE_HEIGHT slices overlapping by TILE_OVERLAP pixels,
+# so a row cut by one tile edge is whole in the next.
+MAX_WIDTH = int(os.getenv("VISION_MAX_WIDTH", "1024"))
+JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "80"))
+TILE_HEIGHT = int(os.getenv("VISION_TILE_HEIGHT", "1600"))
+TILE_OVERLAP = int(os.getenv("VISION_TILE_OVERLAP", "200"))
+
+PROMPT = """
+    You are a financial assistant that extracts structured transaction data from images of bank statements, UPI transactions, or payment screenshots.
+
+    Your goal is to extract **all transactions** visible in the image. For each transaction, identify the following:
+
+    - `date`: Date of the transaction (format: YYYY-MM-DD)
+    - `description`: A short text describing the transaction (e.g., payment to Airtel, refund from Zomato)
+    - `amount`: The numeric amount (positive for credit, negative for debit)
+    - `type`: `"credit"` or `"debit"` depending on the direction of money
+    - `balance`: The account balance after this transaction, if visible
+
+    Output must be **strictly in this format** no other format:
+
+    ```json
+    [
+        {
+            "date": "2025-03-02",
+            "description": "Payment from Manasi Sharma via UPI",
+            "amount": 50.0,
+            "type": "credit",
+            "balance": 29097.45
+        },
+        {
+            "date": "2025-03-03",
+            "description": "Payment to Vi telecom",
+            "amount": -145.0,
+            "type": "debit",
+            "balance": 28952.45
+        }
+    ]```
+    
+    Rules:
+        Return only a valid JSON array of objects, nothing else.
+        If any field is missing or unclear, return its value as null.
+        Do not include any explanation, extra text, or commentary.
+    Begin extracting now.
+    """
+
+
+def preprocess(image_path):
+    """
+    Opens an image upright in RGB, downscaled to MAX_WIDTH.
+    """
+    image = ImageOps.exif_transpose(Image.open(image_path)).convert("RGB")
+    if image.width > MAX_WIDTH:
+        image = image.resize((MAX_WIDTH, round(image.height * MAX_WIDTH / image.width)), Image.LANCZOS)
+    return image
+
+def tiles(image, tile_height=TILE_HEIGHT, overlap=TILE_OVERLAP):
+    """
+    Splits a tall image into overlapping horizontal slices, top to bottom.
+    """
+    if image.height <= tile_height + overlap:
+        return [image]
+    step = tile_height - overlap
+    tops = list(range(0, image.height - overlap, step))
+    return [image.crop((0, top, image.width, min(top + tile_height, image.height))) for top in tops]
+
+def encode(image):
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+def extract_tile(encoded_image):
+    """
+    Sends one encoded image to the vision model and returns its transactions.
+    Failed requests and replies without a JSON array raise, so a statement is
+    never saved with a tile's rows missing.
+    """
+    data = {
+        "model": VISION_MODEL,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": PROMPT,
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{encoded_image}"
+                        }
+                    }
+                ]
+            }
+        ]
+    }
+
+    content = vision.post_json(data)["choices"][0]["message"]["content"]
+    print("🤖 Vision response:", content)
+    records = _json_array(content)
+    if records is None:
+        raise ValueError("Vision model reply holds no JSON array of transactions")
+    # An empty array is a tile without transactions, e.g. below the last row
+    return [r for r in records if isinstance(r, dict)]
+
+def _json_array(content):
+    """
+    Returns the first JSON array in a reply, which may be wrapped in a code
+    fence or surrounded by prose, or None when there is none.
+    """
+    text = re.sub(r"```(?:json)?", "", content)
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\[", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(value, list):
+            return value
+    return None
+
+def _row_key(record):
+    description = " ".join(str(record.get("description") or "").lower().split())
+    return (str(record.get("date")), description, str(record.get("amount")), str(record.get("balance")))
+
+def merge_tiles(results):
+    """
+    Concatenates per-tile transactions in tile order. Rows a tile shares with
+    the tile above come from their overlap and are kept once.
+    """
+    merged = []
+    previous = Counter()
+    for records in results:
+        overlap = Counter(previous)
+        current = Counter()
+        for record in records:
+            key = _row_key(record)
+            current[key] += 1
+            if overlap[key] > 0:
+                overlap[key] -= 1
+                continue
+            merged.append(record)
+        previous = current
+    return merged
+
+def parse_image_file(image_path):
+    """
+    Extracts transactions from a statement image or screenshot, sending its
+    tiles to the vision model concurrently.
+    """
+    encoded = [encode(tile) for tile in tiles(preprocess(image_path))]
+    if len(encoded) == 1:
+        return extract_tile(encoded[0])
+    with ThreadPoolExecutor(max_workers=min(VISION_CONCURRENCY, len(encoded))) as pool, metrics.pending("vision_tiles", len(encoded)):
+        return merge_tiles(list(pool.map(extract_tile, encoded)))
+
+def parse_image_frame(image_path):
+    return records_to_frame(parse_image_file(image_path))
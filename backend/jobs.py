@@ -0,0 +1,156 @@
+import os
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument, ASCENDING, DESCENDING
+
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+MAX_QUEUE_DEPTH = int(os.getenv("JOB_MAX_QUEUE_DEPTH", "200"))
+
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 5
+PRIORITY_HIGH = 10
+
+# queued -> running -> done | failed; a running job whose lease lapses is claimable again,
+# a queued job with `run_after` waits until then
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFull(Exception):
+    """Raised by enqueue when the backlog is at MAX_QUEUE_DEPTH."""
+
+
+class JobQueue:
+    """
+    Mongo-backed job queue. Workers claim the highest-priority, oldest job with a
+    time-limited lease and keep it alive with heartbeats; jobs whose worker died
+    are picked up again once the lease expires.
+    """
+
+    def __init__(self, collection, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, max_depth=MAX_QUEUE_DEPTH):
+        self.collection = collection
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.max_depth = max_depth
+
+    def ensure_indexes(self):
+        self.collection.create_index([("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)])
+        self.collection.create_index([("dedupe_key", ASCENDING), ("status", ASCENDING)])
+
+    def depth(self):
+        return self.collection.count_documents({"status": QUEUED})
+
+    def is_full(self):
+        return self.depth() >= self.max_depth
+
+    def enqueue(self, job_type, payload, priority=PRIORITY_NORMAL, dedupe_key=None, check_depth=True):
+        """
+        Adds a job and returns its id. If a queued or running job already has
+        `dedupe_key`, that job's id is returned instead.
+        """
+        if dedupe_key:
+            existing = self.collection.find_one({"dedupe_key": dedupe_key, "status": {"$in": [QUEUED, RUNNING]}}, {"_id": 1})
+            if existing:
+                return str(existing["_id"])
+        if check_depth and self.is_full():
+            raise QueueFull(f"Job queue is full ({self.max_depth} queued)")
+
+        now = datetime.utcnow()
+        result = self.collection.insert_one({
+            "type": job_type,
+            "payload": payload,
+            "priority": priority,
+            "dedupe_key": dedupe_key,
+            "status": QUEUED,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        })
+        return str(result.inserted_id)
+
+    def claim(self, worker_id, job_types=None):
+        """
+        Leases the next runnable job to `worker_id`, or returns None. A job whose
+        lease expired (its worker died) is taken over while it has attempts left.
+        """
+        now = datetime.utcnow()
+        self.fail_expired(now)
+        query = {"$or": [
+            {"status": QUEUED, "run_after": {"$not": {"$gt": now}}},
+            {"status": RUNNING, "lease_until": {"$lt": now}, "attempts": {"$lt": self.max_attempts}}
+        ]}
+        if job_types:
+            query["type"] = {"$in": list(job_types)}
+
+        return self.collection.find_one_and_update(
+            query,
+            {"$set": {
+                "status": RUNNING,
+                "worker": worker_id,
+                "lease_until": now + self.lease,
+                "heartbeat_at": now,
+                "started_at": now,
+                "updated_at": now
+            }, "$inc": {"attempts": 1}},
+            sort=[("priority", DESCENDING), ("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def fail_expired(self, now=None):
+        """
+        Marks jobs failed whose lease expired on their last attempt, e.g. a job
+        that keeps killing its worker. fail() never runs for those.
+        """
+        now = now or datetime.utcnow()
+        return self.collection.update_many(
+            {"status": RUNNING, "lease_until": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": FAILED, "error": "Lease expired on the last attempt; the worker running it died",
+                      "updated_at": now},
+             "$unset": {"lease_until": ""}}
+        ).modified_count
+
+    def heartbeat(self, job_id, worker_id, progress=None):
+        """
+        Extends the lease. Returns False if the job was taken over by another worker.
+        """
+        now = datetime.utcnow()
+        update = {"lease_until": now + self.lease, "heartbeat_at": now, "updated_at": now}
+        if progress is not None:
+            update["progress"] = progress
+        result = self.collection.update_one({"_id": ObjectId(job_id), "worker": worker_id, "status": RUNNING}, {"$set": update})
+        return result.modified_count == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {"_id": ObjectId(job_id), "worker": worker_id},
+            {"$set": {"status": DONE, "result": result, "finished_at": now, "updated_at": now}, "$unset": {"lease_until": ""}}
+        )
+
+    def fail(self, job_id, worker_id, error):
+        """
+        Re-queues the job, or marks it failed once it has used max_attempts.
+        """
+        job = self.collection.find_one({"_id": ObjectId(job_id)}, {"attempts": 1})
+        now = datetime.utcnow()
+        status = FAILED if job and job.get("attempts", 0) >= self.max_attempts else QUEUED
+        self.collection.update_one(
+            {"_id": ObjectId(job_id), "worker": worker_id},
+            {"$set": {"status": status, "error": str(error), "updated_at": now}, "$unset": {"lease_until": ""}}
+        )
+        return status
+
+    def defer(self, job_id, worker_id, seconds, reason):
+        """
+        Re-queues the job to run after `seconds` without using up an attempt,
+        e.g. while a backend it needs is down.
+        """
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {"_id": ObjectId(job_id), "worker": worker_id},
+            {"$set": {"status": QUEUED, "run_after": now + timedelta(seconds=seconds), "error": str(reason), "updated_at": now},
+             "$unset": {"lease_until": ""}, "$inc": {"attempts": -1}}
+        )
+
+    def get(self, job_id):
+        return self.collection.find_one({"_id": ObjectId(job_id)})
@@ -1,26 +1,58 @@
-import requests
-
-LLM_API_URL = "http://localhost:1234/v1/chat/completions"
-MODEL_NAME = "mistral-7b-instruct-v0.1"
-
-def categorize_batch(descriptions):
-    prompt = """
+import os
+import re
+import json
+import http_client
+
+LLM_API_URL = os.getenv("LLM_API_URL", "http://localhost:1234/v1/chat/completions")
+MODEL_NAME = os.getenv("LLM_MODEL_NAME", "mistral-7b-instruct-v0.1")
+
+# Pooled client shared by all categorization calls (see http_client.py for LLM_CONCURRENCY etc.)
+llm = http_client.from_env("llm", LLM_API_URL, timeout=40)
+
+FALLBACK_RESULT = {"category": "Uncategorized", "note": "Failed to classify"}
+
+class BatchSizeMismatch(ValueError):
+    """The model returned a different number of items than it was sent."""
+
+def _extract_json_list(raw):
+    match = re.search(r"\[.*\]", raw, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON list in response")
+    return json.loads(match.group())
+
+def _extract_json_object(raw):
+    match = re.search(r"\{.*\}", raw, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON object in response")
+    parsed = json.loads(match.group())
+    if not isinstance(parsed, dict) or "category" not in parsed:
+        raise ValueError("Unexpected response format")
+    return {"category": str(parsed["category"]), "note": str(parsed.get("note", ""))}
+
+def request_batch(descriptions, timeout=None):
+    """
+    Classifies several descriptions in one LLM call. Raises on transport errors
+    (after the client's own retries), http_client.CircuitOpen while the server
+    is down, malformed output, and BatchSizeMismatch when the item count is wrong.
+    """
+    prompt = f"""
             You are a smart financial assistant that classifies bank or UPI transactions into relevant categories and explains the reasoning.
 
             Your task is to:
             1. Understand the transaction description.
             2. Infer who or what the payment was to (e.g., a person, store, app, platform, bills, shopping (mart or e-commerce) or service).
             3. Determine the most appropriate category from the following:
-            [Food, Utilities, Entertainment, Travel, Rent, Health, Transfers, Subscriptions, Education, Shopping, Miscellaneous]
+            [Salary, Food, Travel, Shopping, Subscriptions, Utilities, Transfers, Wallets, Rent, Health, Education, Entertainment, Miscellaneous]
 
-            Classify the following transactions. Return a JSON list like:
+            Classify the following {len(descriptions)} transactions. Return exactly {len(descriptions)} items,
+            in the same order, as a JSON list like:
             [
-            {"category": "...", "note": "..."},
+            {{"category": "...", "note": "..."}},
             ...
             ]
             """
 
-    bullet_txns = "\n".join([f"- {desc}" for desc in descriptions])
+    bullet_txns = "\n".join([f"{i}. {desc}" for i, desc in enumerate(descriptions, start=1)])
     full_prompt = prompt + "\n" + bullet_txns
 
     payload = {
@@ -31,20 +63,26 @@ def categorize_batch(descriptions):
         "max_tokens": -1
     }
 
+    raw = llm.post_json(payload, timeout=timeout)['choices'][0]['message']['content']
+    parsed = _extract_json_list(raw.strip())
+    if not all(isinstance(item, dict) and "category" in item for item in parsed):
+        raise ValueError("Unexpected response format")
+    if len(parsed) != len(descriptions):
+        raise BatchSizeMismatch(f"Expected {len(descriptions)} items, got {len(parsed)}")
+    return parsed
+
+def categorize_batch(descriptions):
     try:
-        res = requests.post(LLM_API_URL, json=payload, timeout=40)
-        res.raise_for_status()
-        raw = res.json()['choices'][0]['message']['content']
-        parsed = eval(raw.strip())
-        if isinstance(parsed, list) and all("category" in item for item in parsed):
-            return parsed
-        else:
-            raise ValueError("Unexpected response format")
+        return request_batch(descriptions)
     except Exception as e:
         print(f"❌ LLM batch error: {e}")
-        return [{"category": "Uncategorized", "note": "Failed to classify"} for _ in descriptions]
+        return [dict(FALLBACK_RESULT) for _ in descriptions]
 
 def categorize_transaction(desc):
+    """
+    Classifies one description. Outages (see http_client.is_outage) are raised
+    like in request_batch; other errors and malformed replies give FALLBACK_RESULT.
+    """
     prompt = f"""
             You are a smart financial assistant trained to understand real-world banking and UPI transaction patterns.
 
@@ -94,10 +132,10 @@ def categorize_transaction(desc):
     }
 
     try:
-        res = requests.post(LLM_API_URL, json=payload, timeout=20)
-        res.raise_for_status()
-        raw = res.json()['choices'][0]['message']['content']
-        return eval(raw.strip()) 
+        raw = llm.post_json(payload, timeout=20)['choices'][0]['message']['content']
+        return _extract_json_object(raw.strip())
     except Exception as e:
+        if http_client.is_outage(e):
+            raise
         print(f"❌ LLM error on: {desc[:50]} — {e}")
-        return {"category": "Uncategorized", "note": "Failed to classify"}
\ No newline at end of file
+        return dict(FALLBACK_RESULT)
\ No newline at end of file
@@ -0,0 +1,300 @@
+import os
+import sys
+import time
+import bisect
+import threading
+import traceback
+from collections import Counter as Tally
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# In-process counters, gauges and histograms rendered in the Prometheus text
+# format by /metrics. Worker processes publish snapshots of theirs to the
+# worker_metrics collection ({_id: worker id, metrics, updated_at}), which the
+# API sums into its own output under process="worker".
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PUBLISH_SECONDS = float(os.getenv("METRICS_PUBLISH_SECONDS", "10"))
+STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", "600"))
+
+# Per-request sampling profiler, off unless PROFILING_ENABLED=1
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def samples(self):
+        with self._lock:
+            return [(dict(key), self._copy(value)) for key, value in self._values.items()]
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        # Functions returning [(labels, value)], read at scrape time
+        self.collectors = {}
+
+    def collect_with(self, collect, key=None):
+        """
+        Adds a collector; one registered under the same `key` is replaced.
+        """
+        self.collectors[key if key is not None else id(collect)] = collect
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        samples = super().samples()
+        for collect in list(self.collectors.values()):
+            try:
+                samples += list(collect())
+            except Exception as e:
+                print(f"⚠️ Metric {self.name} could not be collected: {e}")
+        return samples
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            entry["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _copy(self, value):
+        return {"counts": list(value["counts"]), "sum": value["sum"], "count": value["count"]}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self._add(Counter(name, help))
+
+    def gauge(self, name, help):
+        return self._add(Gauge(name, help))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, buckets))
+
+    def snapshot(self):
+        """
+        Plain-data copy of every metric, as stored in worker_metrics.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [
+            {"name": m.name, "kind": m.kind, "help": m.help, "buckets": list(getattr(m, "buckets", [])),
+             "samples": [[labels, value] for labels, value in m.samples()]}
+            for m in metrics
+        ]
+
+
+REGISTRY = Registry()
+
+stage_seconds = REGISTRY.histogram("finwizz_stage_seconds", "Time spent per ingestion stage")
+requests_seconds = REGISTRY.histogram("finwizz_http_request_seconds", "API request latency by endpoint")
+backend_seconds = REGISTRY.histogram("finwizz_backend_request_seconds", "LLM/vision calls, including retries")
+backend_in_flight = REGISTRY.gauge("finwizz_backend_in_flight", "LLM/vision requests currently sent")
+backend_circuit_open = REGISTRY.gauge("finwizz_backend_circuit_open", "1 while a backend's circuit breaker is open or half-open")
+backend_events = REGISTRY.counter("finwizz_backend_events_total", "LLM/vision retries, failures and breaker rejections")
+executor_pending = REGISTRY.gauge("finwizz_executor_pending_tasks", "Tasks submitted to a pool and not finished")
+job_seconds = REGISTRY.histogram("finwizz_job_seconds", "Background job run time")
+job_queue_depth = REGISTRY.gauge("finwizz_job_queue_depth", "Jobs waiting to be claimed")
+cache_events = REGISTRY.counter("finwizz_cache_events_total", "Cache lookups by cache and outcome")
+cache_stats = REGISTRY.gauge("finwizz_cache_stats", "Counts reported by a cache's stats(), e.g. hits and misses")
+sse_listeners = REGISTRY.gauge("finwizz_sse_listeners", "Clients connected to enrichment progress streams")
+
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Times a block into finwizz_stage_seconds{stage=name}.
+    """
+    with stage_seconds.time(stage=name, **labels):
+        yield
+
+
+@contextmanager
+def pending(executor, count=1):
+    """
+    Counts `count` tasks as pending on `executor` for the duration of the block.
+    """
+    executor_pending.inc(count, executor=executor)
+    try:
+        yield
+    finally:
+        executor_pending.inc(-count, executor=executor)
+
+
+def watch_stats(name, stats):
+    """
+    Reports the counts in a component's stats() dict (CategoryCache,
+    LayoutRegistry, ...) as finwizz_cache_stats{cache=name, field=...}. Ratios
+    are left out: they don't add up across processes, hits and misses do.
+    """
+    def collect():
+        return [
+            ({"cache": name, "field": field}, value) for field, value in stats().items()
+            if isinstance(value, int) and not isinstance(value, bool)
+        ]
+    cache_stats.collect_with(collect, key=name)
+
+
+def publish(collection, worker_id):
+    collection.replace_one(
+        {"_id": worker_id},
+        {"metrics": REGISTRY.snapshot(), "updated_at": datetime.utcnow()},
+        upsert=True
+    )
+
+
+def _merge(into, snapshot, process):
+    for metric in snapshot:
+        entry = into.setdefault(metric["name"], {**metric, "samples": {}})
+        for labels, value in metric["samples"]:
+            key = _key({**labels, "process": process})
+            current = entry["samples"].get(key)
+            if current is None:
+                entry["samples"][key] = value
+            elif metric["kind"] == "histogram":
+                entry["samples"][key] = {
+                    "counts": [a + b for a, b in zip(current["counts"], value["counts"])],
+                    "sum": current["sum"] + value["sum"],
+                    "count": current["count"] + value["count"]
+                }
+            else:
+                entry["samples"][key] = current + value
+
+
+def _labels(key, **extra):
+    labels = list(key) + sorted(extra.items())
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def render(worker_metrics=None):
+    """
+    Prometheus text exposition of this process's metrics (process="api") plus
+    the recent snapshots published by workers.
+    """
+    merged = {}
+    _merge(merged, REGISTRY.snapshot(), "api")
+    if worker_metrics is not None:
+        since = datetime.utcnow() - timedelta(seconds=STALE_SECONDS)
+        for doc in worker_metrics.find({"updated_at": {"$gte": since}}):
+            _merge(merged, doc.get("metrics", []), "worker")
+
+    lines = []
+    for name, metric in sorted(merged.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for key, value in sorted(metric["samples"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(key)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + ["+Inf"], value["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(key, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(key)} {value['sum']}")
+            lines.append(f"{name}_count{_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's stack every PROFILE_INTERVAL seconds and counts the
+    collapsed stacks ("outer;inner;leaf count" lines, as flamegraph tools read).
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            self.stacks[";".join(f"{os.path.basename(f.filename)}:{f.name}:{f.lineno}" for f in stack)] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def save(self, name):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{name}.txt")
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+        return path
@@ -0,0 +1,53 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import transaction_store
+
+
+def migrate_upload(collection, transactions, doc, chunk_size=None):
+    """
+    Moves one upload's embedded `data` array into the transactions collection and
+    drops the array. Serials are renumbered by position, since older PDF uploads
+    restarted them per table. Safe to re-run on a half-migrated upload.
+    """
+    upload_id = str(doc["_id"])
+    records = [{**txn, "serial": i} for i, txn in enumerate(doc.get("data", []), start=1)]
+    inserted = transaction_store.insert_transactions(transactions, doc.get("user_id"), upload_id, records, chunk_size)
+
+    # Uploads that were fully enriched before the move keep that status
+    enriched = bool(records) and all("category" in txn for txn in records)
+    update = {"$unset": {"data": ""}, "$set": {"count": len(records)}}
+    if enriched:
+        update["$set"]["enrichment"] = {"status": "done", "position": len(records), "total": len(records)}
+    collection.update_one({"_id": doc["_id"]}, update)
+    return inserted
+
+
+def migrate(collection, transactions, chunk_size=None, dry_run=False):
+    transaction_store.ensure_indexes(transactions)
+    uploads = moved = 0
+    for doc in collection.find({"data": {"$exists": True}}):
+        uploads += 1
+        if dry_run:
+            moved += len(doc.get("data", []))
+            continue
+        moved += migrate_upload(collection, transactions, doc, chunk_size)
+        print(f"✅ Migrated upload {doc['_id']} ({len(doc.get('data', []))} transactions)")
+    return uploads, moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move embedded upload transactions into the transactions collection.")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Rows per insert_many call")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be moved")
+    parser.add_argument("--fingerprints", action="store_true", help="Also fingerprint stored transactions that predate duplicate detection")
+    args = parser.parse_args()
+
+    from database import db
+    uploads, moved = migrate(db["parsed_statements"], db["transactions"], args.chunk_size, args.dry_run)
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"🎉 {verb} {moved} transactions from {uploads} uploads")
+    if args.fingerprints and not args.dry_run:
+        count = transaction_store.backfill_fingerprints(db["transactions"], args.chunk_size)
+        print(f"🔑 Fingerprinted {count} transactions")
@@ -0,0 +1,75 @@
+import threading
+from datetime import datetime
+
+# One document per statement layout in the pdf_layouts collection:
+# {_id: fingerprint (see pdf_parser.probe_layout), flavor, header, columns,
+#  areas: {"first": "x1,y1,x2,y2", "rest": ...}, created_at}
+# header/columns are the normalized first-row cells and their canonical names,
+# so a matching table is mapped by position without fuzzy matching.
+TEMPLATE_FIELDS = ("flavor", "header", "columns", "areas")
+
+
+class LayoutRegistry:
+    """
+    Parse templates for known PDF statement layouts: an in-process dict in front
+    of an optional Mongo collection.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._templates = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "learned": 0, "discarded": 0}
+
+    def get(self, fingerprint):
+        with self._lock:
+            template = self._templates.get(fingerprint)
+        if template is None and self.store is not None:
+            try:
+                doc = self.store.find_one({"_id": fingerprint})
+            except Exception as e:
+                # Without the shared copy the statement is parsed from scratch
+                print(f"⚠️ PDF layout lookup failed: {e}")
+                doc = None
+            if doc:
+                template = {field: doc.get(field) for field in TEMPLATE_FIELDS}
+                with self._lock:
+                    self._templates[fingerprint] = template
+
+        with self._lock:
+            self.counters["hits" if template else "misses"] += 1
+        return template
+
+    def put(self, fingerprint, template):
+        with self._lock:
+            self._templates[fingerprint] = template
+            self.counters["learned"] += 1
+        if self.store is None:
+            return
+        try:
+            self.store.update_one(
+                {"_id": fingerprint},
+                {"$set": template, "$setOnInsert": {"created_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            # The in-process copy still works; the layout is just re-learned elsewhere
+            print(f"⚠️ PDF layout write failed: {e}")
+
+    def discard(self, fingerprint):
+        """
+        Forgets a template that no longer fits its statements, so it is re-learned.
+        """
+        with self._lock:
+            self._templates.pop(fingerprint, None)
+            self.counters["discarded"] += 1
+        if self.store is not None:
+            self.store.delete_one({"_id": fingerprint})
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["templates"] = len(self._templates)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = round(counters["hits"] / lookups, 4) if lookups else None
+        return counters
@@ -1,10 +1,16 @@
 import os
 import re
+import hashlib
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import camelot
 import pdfplumber
 import pandas as pd
 from fuzzywuzzy import fuzz
 from dateutil import parser as dateparser
+from transactions import build_frame, empty_frame, frame_to_records
+import metrics
 
 
 HEADER_MAP = {
@@ -15,121 +21,309 @@ HEADER_MAP = {
     "balance":     ["balance", "closing balance", "bal"]
 }
 
-def parse_pdf_file(pdf_path: str) -> list:
-    if not os.path.isfile(pdf_path):
-        raise FileNotFoundError("PDF file not found.")
+# Long statements are split into page ranges of this size and extracted in parallel
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+# Words that mark a statement's header row when fingerprinting a layout
+HEADER_WORDS = frozenset(word for variants in HEADER_MAP.values() for v in variants for word in v.split())
+HEADER_CELL_GAP = 6  # points between words of one header cell
+
+_pools = {}
+
+def map_header(col_name: str):
+    name = str(col_name or "").strip().lower()
+    for key, variants in HEADER_MAP.items():
+        for v in variants:
+            if name == v or fuzz.ratio(name, v) > 80:
+                return key
+    return None
+
+def parse_amount(val):
+    if pd.isna(val):
+        return 0
+    val = str(val).strip().replace(",", "")
+    if "cr" in val.lower():
+        return float(re.sub(r"[^\d.]", "", val))
+    elif "dr" in val.lower():
+        return -float(re.sub(r"[^\d.]", "", val))
+    try:
+        return float(val)
+    except:
+        return 0
+
+def clean_and_parse(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.dropna(subset=["value date", "description"])
+    df["value date"] = df["value date"].apply(lambda s: dateparser.parse(str(s), dayfirst=True))
+    df["debit"] = df["debit"].apply(parse_amount) if "debit" in df.columns else 0
+    df["credit"] = df["credit"].apply(parse_amount) if "credit" in df.columns else 0
+    df["amount"] = df.apply(lambda r: -r["debit"] if r["debit"] > 0 else r["credit"], axis=1)
+    df["description"] = df["description"].astype(str).str.replace(r"\s+", " ", regex=True).str.strip()
+    if "balance" in df.columns:
+        df["balance"] = df["balance"].apply(parse_amount)
+    df = df.reset_index(drop=True)
+    df.insert(0, "serial", df.index + 1)
+    cols = ["serial", "value date", "description", "amount"]
+    if "balance" in df.columns:
+        cols.append("balance")
+    return df[cols]
+
+def text_to_df(raw_text: str) -> pd.DataFrame:
+    lines = raw_text.splitlines()
+    records = []
+    pattern = re.compile(r"(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}).+?(-?\d+[.,]?\d*)\s+(-?\d+[.,]?\d*)")
+    for line in lines:
+        m = pattern.search(line)
+        if m:
+            date_str, debit_str, credit_str = m.groups()
+            desc = line[:m.start(1)].strip() or line[m.end(1):m.start(2)].strip()
+            records.append({
+                "value date": date_str,
+                "description": desc,
+                "debit": debit_str if float(debit_str.replace(",", "")) > 0 else "",
+                "credit": credit_str if float(credit_str.replace(",", "")) > 0 else ""
+            })
+    return pd.DataFrame(records)
+
+def _normalize(cell) -> str:
+    return re.sub(r"\s+", " ", str(cell or "")).strip().lower()
+
+def _table_columns(table):
+    """
+    Maps a camelot table's first row to canonical columns. Returns the mapping,
+    or None when fewer than two transaction columns are recognised.
+    """
+    df = table.df
+    raw_cols = [str(c) for c in df.iloc[0].tolist()]
+    mapped = [map_header(c) for c in raw_cols]
 
-    def map_header(col_name: str):
-        name = str(col_name or "").strip().lower()
-        for key, variants in HEADER_MAP.items():
-            for v in variants:
-                if name == v or fuzz.ratio(name, v) > 80:
-                    return key
+    # Fix mismatch by trimming or padding
+    if len(mapped) < df.shape[1]:
+        mapped += [None] * (df.shape[1] - len(mapped))  # pad
+    elif len(mapped) > df.shape[1]:
+        mapped = mapped[:df.shape[1]]  # trim
+
+    matched_cols = [col for col in mapped if col in ["value date", "description", "debit", "credit"]]
+    return mapped if len(matched_cols) >= 2 else None
+
+def _clean_table(table, columns):
+    df = table.df[1:].copy()
+    df.columns = columns
+    df = df.loc[:, df.columns.notna()]
+    try:
+        return clean_and_parse(df)
+    except Exception as e:
+        print(f"Failed to clean table on page {table.page}: {e}")
         return None
 
-    def parse_amount(val):
-        if pd.isna(val):
-            return 0
-        val = str(val).strip().replace(",", "")
-        if "cr" in val.lower():
-            return float(re.sub(r"[^\d.]", "", val))
-        elif "dr" in val.lower():
-            return -float(re.sub(r"[^\d.]", "", val))
-        try:
-            return float(val)
-        except:
-            return 0
-
-    def clean_and_parse(df: pd.DataFrame) -> pd.DataFrame:
-        df = df.dropna(subset=["value date", "description"])
-        df["value date"] = df["value date"].apply(lambda s: dateparser.parse(str(s), dayfirst=True))
-        df["debit"] = df["debit"].apply(parse_amount) if "debit" in df.columns else 0
-        df["credit"] = df["credit"].apply(parse_amount) if "credit" in df.columns else 0
-        df["amount"] = df.apply(lambda r: -r["debit"] if r["debit"] > 0 else r["credit"], axis=1)
-        df["description"] = df["description"].astype(str).str.replace(r"\s+", " ", regex=True).str.strip()
-        if "balance" in df.columns:
-            df["balance"] = df["balance"].apply(parse_amount)
-        df = df.reset_index(drop=True)
-        df.insert(0, "serial", df.index + 1)
-        cols = ["serial", "value date", "description", "amount"]
-        if "balance" in df.columns:
-            cols.append("balance")
-        return df[cols]
-
-    def text_to_df(raw_text: str) -> pd.DataFrame:
-        lines = raw_text.splitlines()
-        records = []
-        pattern = re.compile(r"(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}).+?(-?\d+[.,]?\d*)\s+(-?\d+[.,]?\d*)")
-        for line in lines:
-            m = pattern.search(line)
-            if m:
-                date_str, debit_str, credit_str = m.groups()
-                desc = line[:m.start(1)].strip() or line[m.end(1):m.start(2)].strip()
-                records.append({
-                    "value date": date_str,
-                    "description": desc,
-                    "debit": debit_str if float(debit_str.replace(",", "")) > 0 else "",
-                    "credit": credit_str if float(credit_str.replace(",", "")) > 0 else ""
-                })
-        return pd.DataFrame(records)
-
-    # --- Main Logic ---
-    all_records = []
+def _table_area(table) -> str:
+    # camelot bboxes are (x1, y1, x2, y2) from the bottom left. The area runs from
+    # the table's top edge to the foot of the page, since row counts vary.
+    x1, _, x2, top = table._bbox
+    return f"{x1 - 2:.0f},{top + 2:.0f},{x2 + 2:.0f},0"
 
+def table_frames(tables, flavor=None) -> list:
+    """
+    Cleans the camelot tables whose first row maps to known headers; others are
+    skipped. Returns a part per table: its page, cleaned frame and the layout
+    details a template is learned from.
+    """
+    parts = []
+    for table in tables:
+        columns = _table_columns(table)
+        if columns is None:
+            continue
+        frame = _clean_table(table, columns)
+        if frame is not None:
+            parts.append({
+                "page": int(table.page),
+                "frame": frame,
+                "flavor": flavor,
+                "header": [_normalize(c) for c in table.df.iloc[0].tolist()],
+                "columns": columns,
+                "area": _table_area(table),
+            })
+    return parts
+
+def _read_tables(pdf_path, pages, flavor, **kwargs):
     try:
-        tables = camelot.read_pdf(pdf_path, pages="all", flavor="lattice")
-        if tables.n == 0:
-            tables = camelot.read_pdf(pdf_path, pages="all", flavor="stream")
+        return list(camelot.read_pdf(pdf_path, pages=",".join(map(str, pages)), flavor=flavor, **kwargs))
     except Exception:
-        tables = []
-
-    if tables and tables.n > 0:
-        for idx, table in enumerate(tables):
-            df = table.df
-            raw_cols = [str(c) for c in df.iloc[0].tolist()]
-            mapped = [map_header(c) for c in raw_cols]
-
-            # Fix mismatch by trimming or padding
-            if len(mapped) < df.shape[1]:
-                mapped += [None] * (df.shape[1] - len(mapped))  # pad
-            elif len(mapped) > df.shape[1]:
-                mapped = mapped[:df.shape[1]]  # trim
-                
-            matched_cols = [col for col in mapped if col in ["value date", "description", "debit", "credit"]]
-
-            if len(matched_cols) >= 2:
-                df = df[1:].copy()
-                df.columns = mapped
-                df = df.loc[:, df.columns.notna()]
-
-                try:
-                    df = clean_and_parse(df)
-                    for _, row in df.iterrows():
-                        rec = {
-                            "serial": int(row["serial"]),
-                            "value date": row["value date"].isoformat(),
-                            "description": row["description"],
-                            "amount": float(row["amount"])
-                        }
-                        if "balance" in row:
-                            rec["balance"] = float(row["balance"])
-                        all_records.append(rec)
-                except Exception as e:
-                    print(f"Failed to clean table {idx + 1}: {e}")
+        return []
+
+def _discover_pages(pdf_path, pages) -> list:
+    # Lattice first; only the pages where it finds nothing are re-read with stream
+    by_page = {}
+    for table in _read_tables(pdf_path, pages, "lattice"):
+        by_page.setdefault(int(table.page), ("lattice", []))[1].append(table)
+
+    missing = [page for page in pages if page not in by_page]
+    if missing:
+        for table in _read_tables(pdf_path, missing, "stream"):
+            by_page.setdefault(int(table.page), ("stream", []))[1].append(table)
+
+    return [part for page in sorted(by_page) for part in table_frames(by_page[page][1], by_page[page][0])]
+
+def _template_pages(pdf_path, pages, template) -> list:
+    # Straight to the template's flavor and areas; tables are recognised by an
+    # exact header match and mapped by position
+    parts = []
+    areas = template.get("areas") or {}
+    for group, area in (([p for p in pages if p == 1], areas.get("first")), ([p for p in pages if p > 1], areas.get("rest"))):
+        if not group:
+            continue
+        kwargs = {"table_areas": [area]} if area else {}
+        for table in _read_tables(pdf_path, group, template["flavor"], **kwargs):
+            if [_normalize(c) for c in table.df.iloc[0].tolist()] != template["header"]:
+                continue
+            frame = _clean_table(table, template["columns"])
+            if frame is not None:
+                parts.append({"page": int(table.page), "frame": frame})
+    return parts
+
+def extract_pages(pdf_path: str, first: int, last: int, template: dict = None) -> list:
+    """
+    Extracts the tables on pages first..last (1-based, inclusive) as parts (see
+    table_frames) in page order. With a layout template, pages are read with its
+    flavor, areas and column mapping; pages it doesn't fit fall back to discovery.
+    """
+    pages = list(range(first, last + 1))
+    parts = _template_pages(pdf_path, pages, template) if template else []
+
+    found = {part["page"] for part in parts}
+    missing = [page for page in pages if page not in found]
+    if missing:
+        parts += _discover_pages(pdf_path, missing)
+    # sorted() is stable, so tables keep their order within a page
+    return sorted(parts, key=lambda part: part["page"])
+
+def learn_template(parts) -> dict:
+    """
+    Builds a layout template from the parts of a discovery parse.
+    """
+    header = parts[0]["header"]
+    same = [part for part in parts if part["header"] == header]
+    flavor = Counter(part["flavor"] for part in same).most_common(1)[0][0]
+
+    # Stream areas skip its table detection; they are only safe to pin when each
+    # page held a single statement table. Lattice finds tables from ruling lines.
+    areas = {}
+    per_page = Counter(part["page"] for part in same)
+    if flavor == "stream" and max(per_page.values()) == 1:
+        for part in same:
+            if part["flavor"] == flavor:
+                areas.setdefault("first" if part["page"] == 1 else "rest", part["area"])
+
+    return {"flavor": flavor, "header": header, "columns": parts[0]["columns"], "areas": areas}
+
+def _header_cells(words):
+    # Groups pdfplumber words into lines, and words closer than HEADER_CELL_GAP into cells
+    lines = []
+    for word in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        if lines and abs(word["top"] - lines[-1][0]["top"]) <= 2:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+
+    for line in lines:
+        cells, previous = [], None
+        for word in sorted(line, key=lambda w: w["x0"]):
+            if previous is not None and word["x0"] - previous["x1"] <= HEADER_CELL_GAP:
+                cells[-1] += " " + word["text"]
+            else:
+                cells.append(word["text"])
+            previous = word
+        cells = [_normalize(c) for c in cells]
+        if len(cells) >= 3 and sum(any(w in HEADER_WORDS for w in c.split()) for c in cells) >= 2:
+            return cells
+    return None
+
+def probe_layout(pdf_path: str):
+    """
+    Returns (fingerprint, page count). The fingerprint hashes the first page's
+    size with the header row's cells and column count, read with pdfplumber
+    alone; it is None when no header row is found.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        pages = len(pdf.pages)
+        if not pages:
+            return None, 0
+        page = pdf.pages[0]
+        header = _header_cells(page.extract_words())
+        geometry = f"{round(page.width)}x{round(page.height)}"
+    if not header:
+        return None, pages
+    key = "|".join([geometry, str(len(header))] + header)
+    return hashlib.sha1(key.encode()).hexdigest(), pages
+
+def iter_text_frames(pdf_path: str):
+    """
+    pdfplumber fallback for statements without tables: yields one cleaned frame
+    per page, so only one page of text is held at a time.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            df = text_to_df(page.extract_text() or "")
+            page.close()
+            if not df.empty:
+                yield clean_and_parse(df)
+
+def _pool(workers):
+    # Spawned, not forked: the API process holds Mongo clients and threads
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pools[workers]
+
+def parse_pdf_frame(pdf_path: str, workers: int = None, layouts=None) -> pd.DataFrame:
+    """
+    Extracts transactions from a PDF statement into the canonical transaction frame.
+
+    Statements longer than PDF_PAGES_PER_TASK pages are split into page ranges
+    that are extracted in a pool of `workers` processes (PDF_WORKERS by default,
+    1 to stay in-process) and merged back in page order.
+
+    With a LayoutRegistry as `layouts`, statements whose layout was parsed
+    before skip header matching and flavor detection, and new layouts are learned.
+    """
+    if not os.path.isfile(pdf_path):
+        raise FileNotFoundError("PDF file not found.")
+
+    workers = workers or PDF_WORKERS
+    fingerprint, pages = probe_layout(pdf_path)
+    template = layouts.get(fingerprint) if layouts is not None and fingerprint else None
+    ranges = [(first, min(first + PDF_PAGES_PER_TASK - 1, pages)) for first in range(1, pages + 1, PDF_PAGES_PER_TASK)]
+
+    if workers > 1 and len(ranges) > 1:
+        firsts, lasts = zip(*ranges)
+        with metrics.pending("pdf_pages", len(ranges)):
+            results = _pool(workers).map(extract_pages, [pdf_path] * len(ranges), firsts, lasts, [template] * len(ranges))
+            parts = [part for chunk in results for part in chunk]
     else:
-        with pdfplumber.open(pdf_path) as pdf:
-            raw = "\n".join(page.extract_text() or "" for page in pdf.pages)
-        df = text_to_df(raw)
-        df = clean_and_parse(df)
-        for _, row in df.iterrows():
-            rec = {
-                "serial": int(row["serial"]),
-                "value date": row["value date"].isoformat(),
-                "description": row["description"],
-                "amount": float(row["amount"])
-            }
-            if "balance" in row:
-                rec["balance"] = float(row["balance"])
-            all_records.append(rec)
-
-    return all_records
\ No newline at end of file
+        parts = [part for first, last in ranges for part in extract_pages(pdf_path, first, last, template)]
+
+    if layouts is not None and fingerprint:
+        if template is None and parts:
+            layouts.put(fingerprint, learn_template(parts))
+        elif template is not None and not any("header" not in part for part in parts):
+            # Nothing matched the template; let the next statement re-learn the layout
+            layouts.discard(fingerprint)
+    frames = [part["frame"] for part in parts]
+
+    if not frames:
+        frames = list(iter_text_frames(pdf_path))
+    if not frames:
+        return empty_frame()
+
+    df = pd.concat(frames, ignore_index=True)
+    amount = df["amount"].astype(float)
+    return build_frame(
+        df["value date"],
+        df["description"],
+        (-amount).clip(lower=0),
+        amount.clip(lower=0),
+        df["balance"] if "balance" in df.columns else None,
+    )
+
+
+def parse_pdf_file(pdf_path: str, workers: int = None, layouts=None) -> list:
+    return frame_to_records(parse_pdf_frame(pdf_path, workers, layouts), date_key="value date")
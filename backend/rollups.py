@@ -0,0 +1,148 @@
+import argparse
+from datetime import datetime
+
+# One document per user in the user_rollups collection:
+# {_id: user_id, total_uploads, total_transactions, total_debit, total_credit,
+#  months: {"2024-07": {debit, credit, count}}, categories: {"Food": {debit, credit, count}},
+#  backfilled}
+# Kept up to date with $inc on insert, enrichment, recategorization and delete.
+# A doc first created by one of those $inc holds only what happened since, so it
+# starts with backfilled: false and is rebuilt from the uploads before it's read.
+UNCATEGORIZED = "Uncategorized"
+
+
+def _key(name):
+    # Mongo field names can't contain "." or start with "$"
+    return str(name or UNCATEGORIZED).replace(".", "_").lstrip("$") or UNCATEGORIZED
+
+
+def _txn_date(txn):
+    return txn.get("date") or txn.get("value date") or ""
+
+
+def _side(amount):
+    return ("debit", abs(amount)) if amount < 0 else ("credit", amount)
+
+
+def contribution(txns, sign=1):
+    """
+    Returns the $inc document that adds (sign=1) or removes (sign=-1) these
+    transactions from a rollup.
+    """
+    inc = {"total_uploads": sign, "total_transactions": 0, "total_debit": 0.0, "total_credit": 0.0}
+    for txn in txns:
+        side, value = _side(txn.get("amount", 0) or 0)
+        month = _key(str(_txn_date(txn))[:7] or "unknown")
+        category = _key(txn.get("category"))
+
+        inc["total_transactions"] += sign
+        inc[f"total_{side}"] += sign * value
+        for prefix in (f"months.{month}", f"categories.{category}"):
+            inc[f"{prefix}.{side}"] = inc.get(f"{prefix}.{side}", 0.0) + sign * value
+            inc[f"{prefix}.count"] = inc.get(f"{prefix}.count", 0) + sign
+    return inc
+
+
+def apply_upload(rollups, user_id, txns, sign=1):
+    rollups.update_one(
+        {"_id": user_id},
+        {"$inc": contribution(txns, sign), "$set": {"updated_at": datetime.utcnow()},
+         "$setOnInsert": {"backfilled": False}},
+        upsert=True
+    )
+
+
+def move_categories(rollups, user_id, moves):
+    """
+    Moves transactions between categories. `moves` is a list of
+    (amount, old_category, new_category).
+    """
+    inc = {}
+    for amount, old, new in moves:
+        old, new = _key(old), _key(new)
+        if old == new:
+            continue
+        side, value = _side(amount or 0)
+        for category, sign in ((old, -1), (new, 1)):
+            inc[f"categories.{category}.{side}"] = inc.get(f"categories.{category}.{side}", 0.0) + sign * value
+            inc[f"categories.{category}.count"] = inc.get(f"categories.{category}.count", 0) + sign
+    if inc:
+        rollups.update_one(
+            {"_id": user_id},
+            {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}, "$setOnInsert": {"backfilled": False}},
+            upsert=True
+        )
+
+
+def _rounded(breakdown):
+    return {
+        name: {"debit": round(v.get("debit", 0), 2), "credit": round(v.get("credit", 0), 2), "count": v.get("count", 0)}
+        for name, v in sorted((breakdown or {}).items())
+        if v.get("count", 0) > 0
+    }
+
+
+def format_summary(rollup):
+    rollup = rollup or {}
+    return {
+        "total_uploads": rollup.get("total_uploads", 0),
+        "total_transactions": rollup.get("total_transactions", 0),
+        "total_debit": round(rollup.get("total_debit", 0), 2),
+        "total_credit": round(rollup.get("total_credit", 0), 2),
+        "by_month": _rounded(rollup.get("months")),
+        "by_category": _rounded(rollup.get("categories"))
+    }
+
+
+def compute_rollup(collection, transactions, user_id):
+    """
+    Recomputes a user's rollup from the uploads and transactions themselves.
+    """
+    rollup = {"_id": user_id, "total_uploads": 0, "total_transactions": 0, "total_debit": 0.0, "total_credit": 0.0}
+    txns = transactions.find({"user_id": user_id}, {"amount": 1, "date": 1, "category": 1})
+    for field, value in contribution(txns).items():
+        target = rollup
+        *parents, leaf = field.split(".")
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = target.get(leaf, 0) + value
+    rollup["total_uploads"] = collection.count_documents({"user_id": user_id})
+    rollup["updated_at"] = datetime.utcnow()
+    rollup["backfilled"] = True
+    return rollup
+
+
+def rebuild(collection, transactions, rollups, user_ids=None, check_only=False):
+    """
+    Recomputes rollups from source data. Returns the user ids whose stored rollup
+    disagreed with the recomputed one; unless `check_only`, those are replaced.
+    """
+    user_ids = user_ids or collection.distinct("user_id")
+    mismatched = []
+    for user_id in user_ids:
+        fresh = compute_rollup(collection, transactions, user_id)
+        stored = rollups.find_one({"_id": user_id})
+        if format_summary(stored) != format_summary(fresh):
+            mismatched.append(user_id)
+            if not check_only:
+                rollups.replace_one({"_id": user_id}, fresh, upsert=True)
+        elif not check_only and stored is not None and not stored.get("backfilled"):
+            rollups.update_one({"_id": user_id}, {"$set": {"backfilled": True}})
+    return mismatched
+
+
+def needs_backfill(rollup):
+    # Docs from before the flag may have been started by an $inc too
+    return rollup is None or not rollup.get("backfilled")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute per-user summary rollups from uploads and transactions.")
+    parser.add_argument("--user", action="append", help="Only this user id (repeatable)")
+    parser.add_argument("--check", action="store_true", help="Report mismatches without fixing them")
+    args = parser.parse_args()
+
+    from database import db
+    bad = rebuild(db["parsed_statements"], db["transactions"], db["user_rollups"], args.user, check_only=args.check)
+    verb = "Mismatched" if args.check else "Rebuilt"
+    print(f"{verb} {len(bad)} rollups" + (f": {', '.join(bad)}" if bad else ""))
@@ -0,0 +1,78 @@
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+
+# Libraries that only some code paths need; the app imports them on first use.
+# Workers started with --preload import them once in the parent and fork, so
+# each child starts warm instead of paying for them again.
+PRELOAD_MODULES = [
+    "pandas",
+    "sklearn.ensemble",
+    "camelot",
+    "pdfplumber",
+    "PIL.Image",
+    "fuzzywuzzy.fuzz",
+    "pyarrow.ipc",
+    "pdf_parser",
+    "image_parser",
+    "csv_parser",
+]
+
+
+def preload(modules=PRELOAD_MODULES):
+    """
+    Imports `modules`, skipping any that aren't installed. Returns {module: seconds}.
+    """
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"⚠️ Could not preload {name}: {e}")
+            continue
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def import_costs(module="main"):
+    """
+    Imports `module` in a fresh interpreter under `-X importtime` and returns
+    [(module, self_us, cumulative_us)], most expensive (cumulative) first.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    costs = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header row
+        costs.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return sorted(costs, key=lambda c: c[2], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report where startup time goes, per imported module.")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    costs = import_costs(args.module)
+    total = next((cumulative for name, _, cumulative in costs if name == args.module), 0)
+    print(f"{'module':<48} {'self ms':>9} {'cumul. ms':>10}")
+    for name, own, cumulative in costs[:args.top]:
+        print(f"{name:<48} {own / 1000:>9.1f} {cumulative / 1000:>10.1f}")
+    print(f"⏱️ import {args.module}: {total / 1000:.1f} ms across {len(costs)} modules")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_layouts import LayoutRegistry
+import metrics
+
+SUPPORTED_TYPES = ("csv", "pdf", "jpg", "jpeg", "png")
+# Processes parsing the files of one batch upload
+PARSE_WORKERS = int(os.getenv("BATCH_PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+_pool = None
+_layouts = None
+
+
+def parse_file(file_path, ext, layouts=None, pdf_workers=None):
+    """
+    Parses a saved upload into the canonical transaction frame by file type.
+    Each parser's libraries (camelot, pdfplumber, PIL...) load on its first file.
+    """
+    if ext == "csv":
+        from csv_parser import parse_csv_frame
+        return parse_csv_frame(file_path)
+    if ext == "pdf":
+        from pdf_parser import parse_pdf_frame
+        return parse_pdf_frame(file_path, pdf_workers, layouts)
+    from image_parser import parse_image_frame
+    return parse_image_frame(file_path)
+
+
+def _init_process():
+    # Each pool process keeps its own connection to the shared layout templates
+    global _layouts
+    from database import db
+    _layouts = LayoutRegistry(db["pdf_layouts"])
+
+
+def _parse_in_process(file_path, ext):
+    # PDFs are parsed whole here; pages aren't farmed out again from a pool process
+    return parse_file(file_path, ext, _layouts, pdf_workers=1)
+
+
+def _get_pool(workers):
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: the API process holds Mongo clients and threads
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_init_process)
+    return _pool
+
+
+def parse_files(files, workers=None, layouts=None):
+    """
+    Parses [(file_path, ext)] in a process pool of `workers` (PARSE_WORKERS by
+    default, 1 to stay in-process). Returns a (frame, error) pair per file, in order.
+    """
+    workers = workers or PARSE_WORKERS
+    if workers == 1 or len(files) == 1:
+        results = []
+        for file_path, ext in files:
+            try:
+                results.append((parse_file(file_path, ext, layouts), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    results = []
+    with metrics.pending("batch_parse", len(files)):
+        futures = [_get_pool(workers).submit(_parse_in_process, file_path, ext) for file_path, ext in files]
+        for future in futures:
+            try:
+                results.append((future.result(), None))
+            except Exception as e:
+                results.append((None, e))
+    return results
@@ -0,0 +1,145 @@
+import os
+import argparse
+from datetime import datetime
+import pandas as pd
+from pymongo import ASCENDING, UpdateOne
+
+from anomaly_sub_api import detect_hidden_subscriptions, subscription_handles
+import transaction_archive
+
+# One document per (user, handle) in the subscription_series collection:
+# {_id: "<user_id>:<handle>", user_id, handle,
+#  points: [{date, description, debit, upload_id}]  (oldest first, last MAX_POINTS),
+#  subscriptions: [see detect_hidden_subscriptions], updated_at}
+# An upload only re-runs detection for the handles it contains.
+MAX_POINTS = int(os.getenv("SUBSCRIPTION_MAX_POINTS", "120"))
+
+POINT_COLUMNS = ["date", "description", "debit"]
+
+
+def ensure_indexes(series):
+    series.create_index([("user_id", ASCENDING), ("handle", ASCENDING)])
+
+
+def series_id(user_id, handle):
+    return f"{user_id}:{handle}"
+
+
+def _points(frame, upload_id):
+    debits = frame.loc[(frame["debit"] > 0) & frame["date"].notna(), POINT_COLUMNS]
+    return debits.assign(handle=subscription_handles(debits["description"]), upload_id=upload_id)
+
+
+def _push_points(series, user_id, points):
+    """
+    Appends points to each handle's series with one bulk_write. Returns the handles touched.
+    """
+    groups = list(points.groupby("handle"))
+    ops = [
+        UpdateOne(
+            {"_id": series_id(user_id, handle)},
+            {
+                "$setOnInsert": {"user_id": user_id, "handle": handle},
+                "$push": {"points": {
+                    "$each": group.drop(columns="handle").to_dict(orient="records"),
+                    "$sort": {"date": 1},
+                    "$slice": -MAX_POINTS
+                }}
+            },
+            upsert=True
+        )
+        for handle, group in groups
+    ]
+    if ops:
+        series.bulk_write(ops, ordered=False)
+    return [handle for handle, _ in groups]
+
+
+def refresh(series, user_id, handles=None):
+    """
+    Re-runs detection over the stored series of `handles` (all of the user's if
+    None), saves the result on each series and returns the subscriptions found.
+    """
+    query = {"user_id": user_id}
+    if handles is not None:
+        query["handle"] = {"$in": list(handles)}
+    docs = list(series.find(query, {"handle": 1, "points": 1}))
+
+    points = pd.DataFrame([p for doc in docs for p in doc.get("points", [])], columns=POINT_COLUMNS)
+    points["date"] = pd.to_datetime(points["date"])
+    points["debit"] = points["debit"].astype(float)
+    found = detect_hidden_subscriptions(points)
+
+    by_handle = {}
+    for sub in found:
+        by_handle.setdefault(sub["handle"], []).append(sub)
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"subscriptions": by_handle.get(doc["handle"], []), "updated_at": now}})
+        for doc in docs
+    ]
+    if ops:
+        series.bulk_write(ops, ordered=False)
+    return found
+
+
+def record_upload(series, user_id, upload_id, frame):
+    """
+    Adds an upload's debits to the user's series and returns the subscriptions,
+    over the whole history, of the handles this upload charged.
+    """
+    return record_uploads(series, user_id, [(upload_id, frame)])
+
+
+def record_uploads(series, user_id, uploads):
+    """
+    record_upload for [(upload_id, frame)] of one batch: all debits are pushed
+    first, so detection runs once over the handles they charged.
+    """
+    frames = [_points(frame, upload_id) for upload_id, frame in uploads]
+    handles = _push_points(series, user_id, pd.concat(frames)) if frames else []
+    return refresh(series, user_id, handles) if handles else []
+
+
+def forget_upload(series, user_id, upload_id):
+    series.update_many({"user_id": user_id}, {"$pull": {"points": {"upload_id": upload_id}}})
+    refresh(series, user_id)
+
+
+def user_subscriptions(series, user_id):
+    docs = series.find({"user_id": user_id, "subscriptions.0": {"$exists": True}}, {"subscriptions": 1})
+    return sorted((sub for doc in docs for sub in doc["subscriptions"]), key=lambda sub: sub["handle"])
+
+
+def rebuild(transactions, series, user_id, uploads=None):
+    """
+    Recreates a user's series from their transactions, read from the columnar
+    archive when `uploads` is given and the archive is complete.
+    """
+    columns = ["date", "description", "amount", "upload_id"]
+    df = transaction_archive.history(uploads, transactions, user_id, columns, debits=True) if uploads is not None else None
+    if df is None:
+        docs = transactions.find({"user_id": user_id, "amount": {"$lt": 0}}, {"date": 1, "description": 1, "amount": 1, "upload_id": 1})
+        df = pd.DataFrame(list(docs), columns=columns)
+    frame = pd.DataFrame({
+        "date": pd.to_datetime(df["date"], errors="coerce"),
+        "description": df["description"],
+        "debit": -df["amount"].astype(float)
+    })
+    points = _points(frame, None).assign(upload_id=df["upload_id"])
+
+    series.delete_many({"user_id": user_id})
+    _push_points(series, user_id, points)
+    return refresh(series, user_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-user subscription series from the transactions collection.")
+    parser.add_argument("--user", action="append", help="Only this user id (repeatable)")
+    args = parser.parse_args()
+
+    from database import db
+    user_ids = args.user or db["parsed_statements"].distinct("user_id")
+    for user_id in user_ids:
+        found = rebuild(db["transactions"], db["subscription_series"], user_id)
+        print(f"✅ {user_id}: {len(found)} subscriptions")
@@ -0,0 +1,364 @@
+import os
+import hashlib
+import argparse
+import importlib.util
+from functools import lru_cache
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Columnar copy of the transactions collection for analytic reads, as
+# uncompressed Arrow IPC files that are memory-mapped on read:
+#   <ARCHIVE_DIR>/<sha1(user_id)>/month=2024-07/upload-<upload_id>.arrow  written at ingestion
+#   <ARCHIVE_DIR>/<sha1(user_id)>/month=2024-07/compacted.arrow           merged by compact()
+# A compacted file lists the uploads it holds in its schema metadata; loose
+# files of those uploads are ignored, so an interrupted compaction never counts
+# rows twice. Only columns fixed at parse time are archived: categories change
+# after upload and stay in MongoDB. Uploads get `archived: true` once written,
+# and readers fall back to MongoDB while one of the user's uploads isn't.
+# pyarrow is optional; without it nothing is archived.
+ARCHIVE_DIR = os.getenv("TXN_ARCHIVE_DIR", "archive")
+ARCHIVE_ENABLED = os.getenv("TXN_ARCHIVE_ENABLED", "1") == "1"
+# Loose upload files a user can have before a compaction job is queued
+COMPACT_AFTER = int(os.getenv("TXN_ARCHIVE_COMPACT_AFTER", "12"))
+# Uploads younger than this may still be written by their request
+BACKFILL_AFTER_SECONDS = 120
+
+FIELDS = ["upload_id", "serial", "date", "description", "amount", "balance", "fingerprint"]
+COMPACTED = "compacted.arrow"
+UNKNOWN_MONTH = "unknown"
+
+
+@lru_cache(maxsize=1)
+def _pyarrow_installed():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def available():
+    return ARCHIVE_ENABLED and _pyarrow_installed()
+
+
+@lru_cache(maxsize=1)
+def schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("upload_id", pa.string()),
+        ("serial", pa.int32()),
+        ("date", pa.timestamp("ms")),
+        ("description", pa.string()),
+        ("amount", pa.float64()),
+        ("balance", pa.float64()),
+        ("fingerprint", pa.string()),
+    ])
+
+
+def _user_dir(user_id):
+    # User ids come from clients; hashing keeps them out of path syntax
+    return os.path.join(ARCHIVE_DIR, hashlib.sha1(str(user_id).encode()).hexdigest())
+
+
+def _months(user_id):
+    root = _user_dir(user_id)
+    try:
+        names = sorted(os.listdir(root))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(root, name) for name in names if name.startswith("month=")]
+
+
+def _upload_of(path):
+    name = os.path.basename(path)
+    return name[len("upload-"):-len(".arrow")] if name.startswith("upload-") else None
+
+
+@contextmanager
+def _locked(user_id, exclusive=False):
+    """
+    Readers and upload writers share the user's lock; compaction and deletes,
+    which replace and remove files, take it exclusively.
+    """
+    import fcntl  # POSIX only; importing the app must not need it
+
+    root = _user_dir(user_id)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write(path, table):
+    import pyarrow.ipc as ipc
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with ipc.new_file(tmp, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    # Zero-copy: the columns are views of the mapped file, which stays mapped
+    # while they are referenced, even after compaction removes it
+    return ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def _merged_uploads(table):
+    return set((table.schema.metadata or {}).get(b"uploads", b"").decode().split(",")) - {""}
+
+
+def _month_tables(month_dir):
+    """
+    Returns ([(path, table)], merged) for the files of one month partition:
+    the tables read, and the loose files left out because their upload is
+    already in the compacted file. Call under the lock.
+    """
+    paths = sorted(os.path.join(month_dir, name) for name in os.listdir(month_dir) if name.endswith(".arrow"))
+    tables, merged_uploads, merged = [], set(), []
+    compacted = os.path.join(month_dir, COMPACTED)
+    if compacted in paths:
+        table = _read(compacted)
+        merged_uploads = _merged_uploads(table)
+        tables.append((compacted, table))
+    for path in paths:
+        if path == compacted:
+            continue
+        if _upload_of(path) in merged_uploads:
+            merged.append(path)
+        else:
+            tables.append((path, _read(path)))
+    return tables, merged
+
+
+def _to_table(docs):
+    import pyarrow as pa
+    import pandas as pd
+
+    df = pd.DataFrame(list(docs), columns=FIELDS)
+    df["upload_id"] = df["upload_id"].astype(str)
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df["amount"] = df["amount"].astype(float)
+    df["balance"] = pd.to_numeric(df["balance"], errors="coerce")
+    months = df["date"].dt.strftime("%Y-%m").fillna(UNKNOWN_MONTH)
+    return pa.Table.from_pandas(df, schema=schema(), preserve_index=False, safe=False), months
+
+
+def write_upload(user_id, upload_id, docs):
+    """
+    Archives an upload's transaction documents (as built by
+    transaction_store.to_documents), one file per month they fall in.
+    Rewriting an upload replaces its files. Returns the number of rows written.
+    """
+    if not docs:
+        return 0
+    table, months = _to_table(docs)
+    # Shared with other writers, but never interleaved with a compaction
+    with _locked(user_id):
+        for month in sorted(months.unique()):
+            month_dir = os.path.join(_user_dir(user_id), f"month={month}")
+            os.makedirs(month_dir, exist_ok=True)
+            rows = (months == month).to_numpy().nonzero()[0]
+            _write(os.path.join(month_dir, f"upload-{upload_id}.arrow"), table.take(rows))
+    return table.num_rows
+
+
+def mark_archived(uploads, upload_ids):
+    if upload_ids:
+        uploads.update_many({"_id": {"$in": list(upload_ids)}}, {"$set": {"archived": True}})
+
+
+def read(user_id, columns=None, debits=False):
+    """
+    Returns the user's archived transactions as a pyarrow Table with only
+    `columns` (all by default), optionally only debits.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    columns = list(columns or FIELDS)
+    parts = []
+    for month_dir in _months(user_id):
+        with _locked(user_id):
+            tables, _ = _month_tables(month_dir)
+        for _, table in tables:
+            if debits:
+                table = table.filter(pc.less(table["amount"], 0))
+            parts.append(table.select(columns))
+    if not parts:
+        return schema().empty_table().select(columns)
+    return pa.concat_tables(parts)
+
+
+def is_complete(uploads, user_id):
+    """
+    True when every upload of the user with transactions is archived.
+    """
+    return uploads.count_documents(
+        {"user_id": user_id, "archived": {"$ne": True}, "count": {"$gt": 0}}, limit=1
+    ) == 0
+
+
+def backfill(uploads, transactions, user_id=None, min_age=BACKFILL_AFTER_SECONDS):
+    """
+    Archives uploads that aren't yet (stored before the archive existed, or
+    whose archive write failed) from the transactions collection. Uploads
+    younger than `min_age` seconds are left to the request saving them.
+    Returns the number of uploads archived.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age)
+    query = {
+        "archived": {"$ne": True},
+        "count": {"$gt": 0},
+        "$or": [{"uploaded_at": {"$lt": cutoff}}, {"uploaded_at": {"$exists": False}}]
+    }
+    if user_id is not None:
+        query["user_id"] = user_id
+
+    archived = 0
+    for doc in uploads.find(query, {"user_id": 1}):
+        upload_id = str(doc["_id"])
+        txns = transactions.find({"upload_id": upload_id}, {field: 1 for field in FIELDS}).sort("serial", 1)
+        write_upload(doc["user_id"], upload_id, list(txns))
+        mark_archived(uploads, [doc["_id"]])
+        archived += 1
+    return archived
+
+
+def history(uploads, transactions, user_id, columns=None, debits=False):
+    """
+    read() as a DataFrame, after archiving any older uploads that missed it.
+    Returns None when the archive can't answer (pyarrow missing, or an upload
+    still being written), so the caller reads MongoDB instead.
+    """
+    if not available():
+        return None
+    backfill(uploads, transactions, user_id)
+    if not is_complete(uploads, user_id):
+        return None
+    return read(user_id, columns, debits).to_pandas()
+
+
+def loose_files(user_id):
+    """
+    Number of per-upload files not yet merged into a monthly partition.
+    """
+    return sum(
+        1 for month_dir in _months(user_id)
+        for name in os.listdir(month_dir) if name.startswith("upload-") and name.endswith(".arrow")
+    )
+
+
+def compact(user_id):
+    """
+    Merges each month's per-upload files into its compacted file, sorted by
+    date. Returns the number of month partitions rewritten.
+    """
+    import pyarrow as pa
+
+    rewritten = 0
+    with _locked(user_id, exclusive=True):
+        for month_dir in _months(user_id):
+            tables, merged = _month_tables(month_dir)
+            # Only files read here are removed, never one that appeared since
+            loose = [path for path, _ in tables if _upload_of(path) is not None]
+            if loose:
+                table = pa.concat_tables([table.replace_schema_metadata(None) for _, table in tables])
+                table = table.sort_by([("date", "ascending"), ("upload_id", "ascending"), ("serial", "ascending")])
+                uploads = sorted(set(table["upload_id"].to_pylist()))
+                _write(os.path.join(month_dir, COMPACTED), table.replace_schema_metadata({"uploads": ",".join(uploads)}))
+                rewritten += 1
+            # Only now that the compacted file holds their rows
+            for path in loose + merged:
+                os.remove(path)
+    return rewritten
+
+
+def drop_upload(user_id, upload_id):
+    """
+    Removes an upload's rows from the user's archive.
+    """
+    import pyarrow.compute as pc
+
+    if not _months(user_id):
+        return
+    with _locked(user_id, exclusive=True):
+        for month_dir in _months(user_id):
+            loose = os.path.join(month_dir, f"upload-{upload_id}.arrow")
+            if os.path.exists(loose):
+                os.remove(loose)
+            compacted = os.path.join(month_dir, COMPACTED)
+            if not os.path.exists(compacted):
+                continue
+            table = _read(compacted)
+            uploads = _merged_uploads(table)
+            if upload_id not in uploads:
+                continue
+            if uploads == {upload_id}:
+                os.remove(compacted)
+                continue
+            kept = table.filter(pc.not_equal(table["upload_id"], upload_id))
+            _write(compacted, kept.replace_schema_metadata({"uploads": ",".join(sorted(uploads - {upload_id}))}))
+
+
+class _Chunks:
+    """
+    File-like sink for an IPC stream writer; drain() hands out what was written.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def export_stream(user_id, columns=None):
+    """
+    Yields the user's archive as an Arrow IPC stream, a month at a time.
+    """
+    import pyarrow.ipc as ipc
+
+    columns = list(columns or FIELDS)
+    sink = _Chunks()
+    writer = ipc.new_stream(sink, schema().empty_table().select(columns).schema)
+    yield sink.drain()
+    for month_dir in _months(user_id):
+        with _locked(user_id):
+            tables, _ = _month_tables(month_dir)
+        for _, table in tables:
+            writer.write_table(table.select(columns).replace_schema_metadata(None))
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the columnar transaction archive.")
+    parser.add_argument("--user", action="append", help="Only this user id (repeatable)")
+    parser.add_argument("--backfill", action="store_true", help="Archive uploads stored before the archive existed")
+    parser.add_argument("--compact", action="store_true", help="Merge per-upload files into monthly partitions")
+    args = parser.parse_args()
+
+    if not available():
+        raise SystemExit("pyarrow is not installed or TXN_ARCHIVE_ENABLED=0")
+    from database import db
+    user_ids = args.user or db["parsed_statements"].distinct("user_id")
+    for user_id in user_ids:
+        if args.backfill:
+            print(f"📦 {user_id}: archived {backfill(db['parsed_statements'], db['transactions'], user_id, min_age=0)} uploads")
+        if args.compact:
+            print(f"🗜️ {user_id}: compacted {compact(user_id)} month partitions")
@@ -0,0 +1,229 @@
+import os
+import re
+import hashlib
+from collections import Counter
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from category_cache import merchant_key
+
+# One document per transaction in the transactions collection:
+# {_id: "<upload_id>:<serial>", user_id, upload_id, serial, date, description,
+#  amount, balance?, fingerprint, merchant, category?, note?}
+# The _id is derived from the upload and position, so it is stable across re-runs.
+# `fingerprint` identifies the same transaction across a user's overlapping statements,
+# and is unique per user, so two uploads racing past mark_new can't both store a row.
+# `merchant` is category_cache.merchant_key(description), for merchant-wide recategorization.
+INSERT_CHUNK = int(os.getenv("TXN_INSERT_CHUNK", "1000"))
+DUPLICATE_KEY = 11000
+FINGERPRINT_INDEX = "user_id_1_fingerprint_1_unique"
+
+
+def ensure_indexes(transactions):
+    transactions.create_index([("user_id", ASCENDING), ("date", ASCENDING)])
+    transactions.create_index([("upload_id", ASCENDING), ("serial", ASCENDING)], unique=True)
+    transactions.create_index([("user_id", ASCENDING), ("category", ASCENDING)])
+    transactions.create_index([("user_id", ASCENDING), ("merchant", ASCENDING)])
+    ensure_fingerprint_index(transactions)
+
+
+def ensure_fingerprint_index(transactions):
+    """
+    Builds the unique (user_id, fingerprint) index, then drops the plain one it
+    replaces. Rows from before fingerprinting have none and stay out of it.
+    While stored rows still repeat a fingerprint the build fails, and the plain
+    index is kept so duplicate lookups stay fast.
+    """
+    keys = [("user_id", ASCENDING), ("fingerprint", ASCENDING)]
+    try:
+        transactions.create_index(keys, unique=True, name=FINGERPRINT_INDEX,
+                                  partialFilterExpression={"fingerprint": {"$exists": True}})
+    except OperationFailure as e:
+        print(f"⚠️ Stored transactions repeat fingerprints, duplicate detection is not race-free: {e}")
+        transactions.create_index(keys)
+        return False
+    if "user_id_1_fingerprint_1" in transactions.index_information():
+        transactions.drop_index("user_id_1_fingerprint_1")
+    return True
+
+
+def txn_id(upload_id, serial):
+    return f"{upload_id}:{serial}"
+
+
+def _fingerprint_key(txn):
+    balance = txn.get("balance")
+    balance = "" if balance is None or balance != balance else f"{float(balance):.2f}"
+    description = " ".join(re.sub(r"[^a-z0-9@]+", " ", str(txn.get("description") or "").lower()).split())
+    day = str(txn.get("date") or txn.get("value date") or "")[:10]
+    return f"{day}|{float(txn.get('amount') or 0):.2f}|{balance}|{description}"
+
+
+def fingerprints(records):
+    """
+    Hashes (date, amount, balance, normalized description) per record. Identical
+    rows within one statement are told apart by their occurrence number, so two
+    same-day coffees stay two transactions while a re-uploaded pair matches.
+    """
+    seen = Counter()
+    result = []
+    for txn in records:
+        key = _fingerprint_key(txn)
+        seen[key] += 1
+        result.append(hashlib.sha1(f"{key}|{seen[key]}".encode()).hexdigest())
+    return result
+
+
+def mark_new(transactions, user_id, records, chunk_size=None, seen=None):
+    """
+    Sets `fingerprint` on each record and looks them up in bulk against the
+    user's stored transactions. Returns a list of booleans, True for new rows.
+    `seen` is a set of fingerprints already taken by earlier files of the same
+    batch; the new ones are added to it.
+    """
+    chunk_size = chunk_size or INSERT_CHUNK
+    prints = fingerprints(records)
+    existing = set()
+    for start in range(0, len(prints), chunk_size):
+        docs = transactions.find(
+            # $exists matches the partial index's filter, so the lookup can use it
+            {"user_id": user_id, "fingerprint": {"$in": prints[start:start + chunk_size], "$exists": True}},
+            {"_id": 0, "fingerprint": 1}
+        )
+        existing.update(doc["fingerprint"] for doc in docs)
+    if seen is not None:
+        existing.update(seen)
+        seen.update(prints)
+
+    for txn, fingerprint in zip(records, prints):
+        txn["fingerprint"] = fingerprint
+    return [fingerprint not in existing for fingerprint in prints]
+
+
+def backfill_fingerprints(transactions, chunk_size=None):
+    """
+    Fingerprints stored transactions that predate fingerprinting, one upload at
+    a time in serial order. Returns the number of transactions updated.
+    """
+    chunk_size = chunk_size or INSERT_CHUNK
+    updated = 0
+    for upload_id in transactions.distinct("upload_id", {"fingerprint": {"$exists": False}}):
+        txns = list(transactions.find({"upload_id": upload_id}).sort("serial", ASCENDING))
+        ops = [
+            UpdateOne({"_id": txn["_id"]}, {"$set": {"fingerprint": fingerprint}})
+            for txn, fingerprint in zip(txns, fingerprints(txns))
+            if "fingerprint" not in txn
+        ]
+        for start in range(0, len(ops), chunk_size):
+            transactions.bulk_write(ops[start:start + chunk_size], ordered=False)
+        updated += len(ops)
+    return updated
+
+
+def to_documents(user_id, upload_id, records):
+    if any("fingerprint" not in record for record in records):
+        records = [{**record, "fingerprint": fingerprint} for record, fingerprint in zip(records, fingerprints(records))]
+    docs = []
+    for record in records:
+        doc = {k: v for k, v in record.items() if k != "value date"}
+        doc.setdefault("date", record.get("value date"))
+        doc["merchant"] = merchant_key(doc.get("description"))
+        doc.update({"_id": txn_id(upload_id, doc["serial"]), "user_id": user_id, "upload_id": upload_id})
+        docs.append(doc)
+    return docs
+
+
+def insert_transactions(transactions, user_id, upload_id, records, chunk_size=None):
+    """
+    Inserts an upload's records with ordered insert_many calls of `chunk_size`.
+    Rows that already exist (same upload and serial) are left as they are, so a
+    repeated insert is harmless. Returns the number of new rows.
+    """
+    return insert_documents(transactions, to_documents(user_id, upload_id, records), chunk_size)
+
+
+def insert_documents(transactions, docs, chunk_size=None, duplicates=None):
+    """
+    insert_transactions for documents already built by to_documents, possibly
+    of several uploads. Rows whose fingerprint the user already has, stored by
+    another upload since mark_new looked, are skipped as well; `duplicates` is a
+    list the skipped documents are appended to.
+    """
+    chunk_size = chunk_size or INSERT_CHUNK
+    inserted = 0
+    for start in range(0, len(docs), chunk_size):
+        chunk = docs[start:start + chunk_size]
+        try:
+            inserted += len(transactions.insert_many(chunk, ordered=True).inserted_ids)
+        except BulkWriteError as e:
+            if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                raise
+            # Ordered inserts stop at the first duplicate; retry the rest one by one
+            inserted += e.details.get("nInserted", 0)
+            for doc in chunk[e.details.get("nInserted", 0):]:
+                try:
+                    transactions.insert_one(doc)
+                    inserted += 1
+                except DuplicateKeyError:
+                    if duplicates is not None and transactions.count_documents({"_id": doc["_id"]}, limit=1) == 0:
+                        duplicates.append(doc)
+    return inserted
+
+
+def upload_chunk(transactions, upload_id, after_serial, limit):
+    """
+    Returns up to `limit` transactions of an upload with serial > after_serial.
+    """
+    return list(
+        transactions.find({"upload_id": upload_id, "serial": {"$gt": after_serial}})
+        .sort("serial", ASCENDING)
+        .limit(limit)
+    )
+
+
+def set_categories(transactions, updates):
+    """
+    Applies [(txn_id, {"category", "note"})] with one unordered bulk_write.
+    """
+    if updates:
+        transactions.bulk_write([UpdateOne({"_id": _id}, {"$set": fields}) for _id, fields in updates], ordered=False)
+
+
+def merchant_transactions(transactions, user_id, key, projection=None, chunk_size=None):
+    """
+    Returns the user's transactions from merchant `key`. Rows stored before
+    `merchant` was recorded get it on the way, so each is scanned only once.
+    """
+    chunk_size = chunk_size or INSERT_CHUNK
+    untagged = transactions.find({"user_id": user_id, "merchant": {"$exists": False}}, {"description": 1})
+    ops = [UpdateOne({"_id": txn["_id"]}, {"$set": {"merchant": merchant_key(txn.get("description"))}}) for txn in untagged]
+    for start in range(0, len(ops), chunk_size):
+        transactions.bulk_write(ops[start:start + chunk_size], ordered=False)
+    return list(transactions.find({"user_id": user_id, "merchant": key}, projection))
+
+
+def date_filter(date_from=None, date_to_exclusive=None):
+    query = {}
+    if date_from:
+        query["$gte"] = date_from
+    if date_to_exclusive:
+        query["$lt"] = date_to_exclusive
+    return {"date": query} if query else {}
+
+
+def attach_data(transactions, uploads, date_from=None, date_to_exclusive=None):
+    """
+    Fills each upload's `data` list from the transactions collection with one
+    query, in serial order, so responses keep the embedded-array shape.
+    """
+    by_upload = {str(doc["_id"]): doc for doc in uploads}
+    for doc in uploads:
+        doc["data"] = []
+    if not by_upload:
+        return uploads
+
+    query = {"upload_id": {"$in": list(by_upload)}, **date_filter(date_from, date_to_exclusive)}
+    cursor = transactions.find(query, {"user_id": 0, "fingerprint": 0, "merchant": 0}).sort([("upload_id", ASCENDING), ("serial", ASCENDING)])
+    for txn in cursor:
+        by_upload[txn.pop("upload_id")]["data"].append(txn)
+    return uploads
@@ -0,0 +1,94 @@
+import pandas as pd
+import numpy as np
+
+# Canonical, typed transaction frame shared by every parser and by anomaly analysis.
+#   serial       int     1-based position in the statement
+#   date         datetime
+#   description  str     whitespace-collapsed
+#   debit        float   money out, positive, 0 when not a debit
+#   credit       float   money in, positive, 0 when not a credit
+#   amount       float   signed: -debit or +credit
+#   balance      float   NaN when the statement has no balance
+TRANSACTION_COLUMNS = ["serial", "date", "description", "debit", "credit", "amount", "balance"]
+
+
+def build_frame(dates, descriptions, debit, credit, balance=None) -> pd.DataFrame:
+    """
+    Assembles a canonical frame from already-parsed columns. `debit` and `credit`
+    are 0-filled numeric arrays as found on the statement.
+    """
+    debit = np.asarray(debit, dtype=float)
+    credit = np.asarray(credit, dtype=float)
+    n = len(debit)
+    amount = np.where(debit > 0, -debit, credit).astype(float)
+    if balance is None:
+        balance = np.full(n, np.nan)
+
+    return pd.DataFrame({
+        "serial": np.arange(1, n + 1),
+        "date": pd.Series(dates).reset_index(drop=True),
+        "description": pd.Series(descriptions, dtype=object).reset_index(drop=True),
+        "debit": np.where(amount < 0, -amount, 0.0),
+        "credit": np.where(amount > 0, amount, 0.0),
+        "amount": amount,
+        "balance": np.asarray(balance, dtype=float),
+    })
+
+
+def empty_frame() -> pd.DataFrame:
+    return build_frame(pd.Series([], dtype="datetime64[ns]"), [], [], [])
+
+
+def records_to_frame(records) -> pd.DataFrame:
+    """
+    Builds a canonical frame from loosely-shaped records, e.g. the vision model output
+    ({date, description, amount, type, balance}).
+    """
+    if not isinstance(records, list):
+        records = [records] if isinstance(records, dict) else []
+
+    df = pd.DataFrame(records)
+    if "date" not in df.columns and "value date" in df.columns:
+        df = df.rename(columns={"value date": "date"})
+    if df.empty or "date" not in df.columns or "description" not in df.columns:
+        return empty_frame()
+
+    df = df.dropna(subset=["date", "description"]).reset_index(drop=True)
+    amount = pd.to_numeric(df.get("amount"), errors="coerce").fillna(0) if "amount" in df.columns else pd.Series(0.0, index=df.index)
+    if "type" in df.columns:
+        is_debit = df["type"].astype(str).str.lower().eq("debit")
+        amount = amount.where(~is_debit, -amount.abs())
+
+    balance = pd.to_numeric(df["balance"], errors="coerce") if "balance" in df.columns else None
+    return build_frame(
+        pd.to_datetime(df["date"], errors="coerce"),
+        df["description"].astype(str).str.replace(r"\s+", " ", regex=True).str.strip(),
+        (-amount).clip(lower=0),
+        amount.clip(lower=0),
+        balance,
+    )
+
+
+def frame_to_records(frame: pd.DataFrame, date_key: str = "date") -> list:
+    """
+    Turns a canonical frame into the JSON-ready records stored on an upload.
+    """
+    balance = frame["balance"].to_numpy(dtype=float)
+    has_balance = ~np.isnan(balance)
+
+    records = []
+    for serial, dt, desc, amt, bal, has_bal in zip(
+        frame["serial"].tolist(), frame["date"], frame["description"].tolist(),
+        frame["amount"].tolist(), balance.tolist(), has_balance.tolist()
+    ):
+        entry = {
+            "serial": serial,
+            date_key: dt.isoformat() if not pd.isna(dt) else None,
+            "description": desc,
+            "amount": amt
+        }
+        if has_bal:
+            entry["balance"] = bal
+        records.append(entry)
+
+    return records
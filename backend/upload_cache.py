@@ -0,0 +1,135 @@
+import os
+import hashlib
+import pickle
+import tempfile
+from datetime import datetime
+import pandas as pd
+from bson import ObjectId
+
+from category_cache import is_cacheable
+
+# One document per distinct file in the upload_cache collection:
+# {_id: sha256, files: [paths], bytes, user_id, insights, categories?, created_at, last_used}
+# The upload is kept as <sha256>.<ext> and its parsed frame as <sha256>.frame.pkl.
+# `insights` were computed for `user_id`; `categories` are [category, note] per
+# serial, saved once the first upload of the file is fully enriched.
+MAX_BYTES = int(os.getenv("UPLOAD_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+READ_CHUNK = 1024 * 1024
+
+
+class UploadCache:
+    """
+    Content-addressed store of uploaded files and their parse results, kept
+    under a disk budget by evicting the least recently used files.
+    """
+
+    def __init__(self, store, folder, max_bytes=MAX_BYTES):
+        self.store = store
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def ensure_indexes(self):
+        self.store.create_index("last_used")
+
+    def save(self, file, ext):
+        """
+        Streams an uploaded file to disk under its SHA-256. Returns (hash, path).
+        """
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=self.folder, delete=False) as tmp:
+            for chunk in iter(lambda: file.stream.read(READ_CHUNK), b""):
+                digest.update(chunk)
+                tmp.write(chunk)
+        content_hash = digest.hexdigest()
+        path = os.path.join(self.folder, f"{content_hash}.{ext}")
+        os.replace(tmp.name, path)
+        return content_hash, path
+
+    def _frame_path(self, content_hash):
+        return os.path.join(self.folder, f"{content_hash}.frame.pkl")
+
+    def lookup(self, content_hash):
+        """
+        Returns the cached entry with its parsed `frame`, or None.
+        """
+        doc = self.store.find_one_and_update({"_id": content_hash}, {"$set": {"last_used": datetime.utcnow()}})
+        if not doc:
+            return None
+        try:
+            doc["frame"] = pd.read_pickle(self._frame_path(content_hash))
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError) as e:
+            print(f"⚠️ Cached parse for {content_hash} is unreadable, re-parsing: {e}")
+            self.store.delete_one({"_id": content_hash})
+            return None
+        return doc
+
+    def put(self, content_hash, path, frame, user_id, insights):
+        frame_path = self._frame_path(content_hash)
+        frame.to_pickle(frame_path)
+        now = datetime.utcnow()
+        self.store.update_one(
+            {"_id": content_hash},
+            {
+                "$set": {
+                    "files": [path, frame_path],
+                    "bytes": os.path.getsize(path) + os.path.getsize(frame_path),
+                    "user_id": user_id,
+                    "insights": insights,
+                    "last_used": now
+                },
+                "$setOnInsert": {"created_at": now}
+            },
+            upsert=True
+        )
+        self.evict()
+
+    def remember_categories(self, collection, transactions, upload_id):
+        """
+        Saves a fully enriched upload's categories on its file's entry, unless
+        some rows only got the fallback category, were skipped as duplicates or
+        took the uploader's own category overrides.
+        """
+        doc = collection.find_one(
+            {"_id": ObjectId(upload_id)},
+            {"content_hash": 1, "duplicates": 1, "enrichment.status": 1, "enrichment.overridden": 1}
+        )
+        if not doc or not doc.get("content_hash") or doc.get("duplicates"):
+            return False
+        enrichment = doc.get("enrichment", {})
+        if enrichment.get("status") != "done" or enrichment.get("overridden"):
+            return False
+        txns = list(transactions.find({"upload_id": upload_id}, {"category": 1, "note": 1}).sort("serial", 1))
+        if not all(is_cacheable(txn) for txn in txns):
+            return False
+        result = self.store.update_one(
+            {"_id": doc["content_hash"], "categories": {"$exists": False}},
+            {"$set": {"categories": [[txn["category"], txn.get("note", "")] for txn in txns]}}
+        )
+        return result.modified_count > 0
+
+    def total_bytes(self):
+        result = list(self.store.aggregate([{"$group": {"_id": None, "bytes": {"$sum": "$bytes"}}}]))
+        return result[0]["bytes"] if result else 0
+
+    def evict(self):
+        """
+        Removes least recently used files until the cache fits max_bytes.
+        Returns the number of entries evicted.
+        """
+        excess = self.total_bytes() - self.max_bytes
+        evicted = 0
+        if excess <= 0:
+            return evicted
+        for doc in self.store.find({}, {"files": 1, "bytes": 1}).sort("last_used", 1):
+            for path in doc.get("files", []):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.store.delete_one({"_id": doc["_id"]})
+            evicted += 1
+            excess -= doc.get("bytes", 0)
+            if excess <= 0:
+                break
+        return evicted
@@ -0,0 +1,191 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+import os
+import time
+import signal
+import socket
+import argparse
+import threading
+import multiprocessing
+
+from jobs import JobQueue, PRIORITY_NORMAL
+from enrichment import enrich_upload
+from category_cache import CategoryCache
+from category_rules import RuleMatcher
+import anomaly_models
+import transaction_archive
+from upload_cache import UploadCache
+from http_client import CircuitOpen
+import metrics
+
+POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "4"))
+UPLOAD_FOLDER = "uploads"
+
+
+def run_enrich(ctx, payload):
+    result = enrich_upload(
+        ctx["collection"], ctx["transactions"], payload["upload_id"],
+        cache=ctx["cache"], rules=ctx["rules"], force=payload.get("force", False),
+        rollups=ctx["rollups"], overrides=ctx["overrides"]
+    )
+    # Later uploads of the same file reuse these categories
+    ctx["upload_cache"].remember_categories(ctx["collection"], ctx["transactions"], payload["upload_id"])
+    return result
+
+
+def run_train_anomaly_model(ctx, payload):
+    return {"trained_on": anomaly_models.train(
+        ctx["anomaly_models"], ctx["transactions"], payload["user_id"], uploads=ctx["collection"]
+    )}
+
+
+def run_compact_archive(ctx, payload):
+    return {"partitions": transaction_archive.compact(payload["user_id"])}
+
+
+HANDLERS = {
+    "enrich": run_enrich,
+    "train_anomaly_model": run_train_anomaly_model,
+    "compact_archive": run_compact_archive,
+}
+
+
+def build_context(db):
+    cache, rules = CategoryCache(db["category_cache"]), RuleMatcher()
+    cache.ensure_indexes()
+    metrics.watch_stats("category_cache", cache.stats)
+    metrics.watch_stats("category_rules", rules.stats)
+    return {
+        "collection": db["parsed_statements"],
+        "transactions": db["transactions"],
+        "cache": cache,
+        "rules": rules,
+        "rollups": db["user_rollups"],
+        "anomaly_models": db["anomaly_models"],
+        "overrides": db["category_overrides"],
+        "upload_cache": UploadCache(db["upload_cache"], UPLOAD_FOLDER),
+    }
+
+
+def requeue_unfinished(queue, collection):
+    """
+    Enqueues enrichment for uploads left pending or half-done without a live job,
+    e.g. uploads accepted before the job queue existed.
+    """
+    count = 0
+    for doc in collection.find({"enrichment.status": {"$in": ["pending", "running"]}}, {"_id": 1}):
+        upload_id = str(doc["_id"])
+        queue.enqueue("enrich", {"upload_id": upload_id}, priority=PRIORITY_NORMAL,
+                      dedupe_key=f"enrich:{upload_id}", check_depth=False)
+        count += 1
+    return count
+
+
+def _keep_alive(queue, job_id, worker_id, stop):
+    interval = max(queue.lease.total_seconds() / 3, 1)
+    while not stop.wait(interval):
+        if not queue.heartbeat(job_id, worker_id):
+            print(f"⚠️ {worker_id} lost the lease on job {job_id}")
+            return
+
+
+def run_job(queue, ctx, job, worker_id):
+    job_id = str(job["_id"])
+    stop = threading.Event()
+    beat = threading.Thread(target=_keep_alive, args=(queue, job_id, worker_id, stop), daemon=True)
+    beat.start()
+    start = time.perf_counter()
+    outcome = "done"
+    try:
+        result = HANDLERS[job["type"]](ctx, job["payload"])
+        queue.complete(job_id, worker_id, result)
+        print(f"✅ {worker_id} finished {job['type']} job {job_id}")
+    except CircuitOpen as e:
+        outcome = "deferred"
+        queue.defer(job_id, worker_id, e.retry_after, e)
+        print(f"⏸️ {worker_id} deferred {job['type']} job {job_id}: {e}")
+    except Exception as e:
+        outcome = "failed"
+        status = queue.fail(job_id, worker_id, e)
+        print(f"🔥 {worker_id} {job['type']} job {job_id} failed ({status}): {e}")
+    finally:
+        metrics.job_seconds.observe(time.perf_counter() - start, type=job["type"], outcome=outcome)
+        stop.set()
+        beat.join()
+
+
+def work_loop(worker_id, stop=None, once=False, db=None):
+    """
+    Claims and runs jobs until `stop` is set. With `once`, returns after the
+    queue is first found empty (used for tests and one-shot runs).
+    """
+    if db is None:
+        from database import db  # connect inside the worker process, never across a fork
+    queue = JobQueue(db["jobs"])
+    ctx = build_context(db)
+    stop = stop or threading.Event()
+    published = 0.0
+
+    try:
+        while not stop.is_set():
+            # The API serves these on /metrics alongside its own
+            if time.monotonic() - published >= metrics.PUBLISH_SECONDS:
+                metrics.publish(db["worker_metrics"], worker_id)
+                published = time.monotonic()
+            job = queue.claim(worker_id, HANDLERS)
+            if job is None:
+                if once:
+                    return
+                stop.wait(POLL_SECONDS)
+                continue
+            run_job(queue, ctx, job, worker_id)
+    finally:
+        metrics.publish(db["worker_metrics"], worker_id)
+
+
+def _process_main(index):
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    work_loop(f"{socket.gethostname()}:{os.getpid()}:{index}", stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run FinWizz background job workers.")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    parser.add_argument("--preload", action="store_true",
+                        help="Import the heavy libraries once and fork warm workers (POSIX only)")
+    args = parser.parse_args()
+
+    import database
+    queue = JobQueue(database.db["jobs"])
+    queue.ensure_indexes()
+    print(f"🔁 Re-queued {requeue_unfinished(queue, database.db['parsed_statements'])} unfinished uploads")
+
+    if args.preload:
+        import startup
+        timings = startup.preload()
+        print(f"📦 Preloaded {len(timings)} modules in {sum(timings.values()):.2f}s")
+        # MongoClient isn't fork-safe: children open their own on first use
+        database.close()
+        ctx = multiprocessing.get_context("fork")
+    else:
+        ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_process_main, args=(i,)) for i in range(args.processes)]
+    for p in procs:
+        p.start()
+    print(f"🚀 Started {len(procs)} worker processes")
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,7 @@ const Reports = () => {
     const fetchData = async () => {
       try {
         setLoading(true);
-        const res = await fetch(`http://127.0.0.1:5000/api/user/${user.id}/statements`);
+        const res = await fetch(`http://127.0.0.1:5000/api/user/${user.id}/statements?fields=data,insights`);
         const json = await res.json();
         setUploads(json.uploads || []);
       } catch (err) {
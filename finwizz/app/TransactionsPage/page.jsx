@@ -22,18 +22,16 @@ const TransactionsPage = () => {
 
   useEffect(() => {
     const fetchTxns = async () => {
-      const res = await fetch(`http://localhost:5000/api/user/${user.id}/statements`);
+      const [res, subsRes] = await Promise.all([
+        fetch(`http://localhost:5000/api/user/${user.id}/statements?fields=data`),
+        fetch(`http://localhost:5000/api/user/${user.id}/subscriptions`),
+      ]);
       const data = await res.json();
+      const subsData = await subsRes.json();
       const flatData = data.uploads.flatMap(upload =>
         upload.data.map(txn => ({ ...txn, uploadId: upload._id }))
       );
-      const subscriptions = [];
-      for (const upload of data.uploads) {
-        if (upload.insights?.hidden_subscriptions) {
-          subscriptions.push(...upload.insights.hidden_subscriptions);
-        }
-      }
-      setRecurring(subscriptions);
+      setRecurring(subsData.subscriptions || []);
 
       setTransactions(flatData);
       setFiltered(flatData);
@@ -213,7 +211,7 @@ const TransactionsPage = () => {
               <div className="grid gap-4">
                 {recurring.map((sub, index) => (
                   <div key={index} className="bg-indigo-50 p-4 rounded shadow">
-                    <p className="font-semibold mb-1">{sub.handle} — ₹{sub.amount}</p>
+                    <p className="font-semibold mb-1">{sub.handle} — ₹{sub.amount} {sub.cadence}</p>
                     <ul className="list-disc list-inside text-sm text-gray-700 space-y-1">
                       {sub.transactions.map((txn, i) => (
                         <li key={i}>
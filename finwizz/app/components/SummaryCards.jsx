@@ -305,7 +305,7 @@ const SummaryCards = () => {
           <ul className="list-disc list-inside space-y-2 text-sm text-gray-700">
             {insights.hidden_subscriptions.map((sub, idx) => (
               <li key={idx}>
-                {sub.handle} — ₹{sub.amount} monthly × {sub.transactions.length} times
+                {sub.handle} — ₹{sub.amount} {sub.cadence || "monthly"} × {sub.transactions.length} times
               </li>
             ))}
           </ul>
@@ -8,6 +8,28 @@ const UploadForm = ({ onUploadComplete }) => {
   const [file, setFile] = useState(null);
   const [status, setStatus] = useState("");
 
+  const watchEnrichment = (uploadId) => {
+    const events = new EventSource(`http://localhost:5000/api/upload/${uploadId}/events`);
+
+    events.addEventListener("progress", (e) => {
+      const { position, total } = JSON.parse(e.data);
+      setStatus(`Categorizing transactions: ${position}/${total}`);
+    });
+    events.addEventListener("done", () => {
+      events.close();
+      setStatus("Upload successful: transactions categorized");
+      if (onUploadComplete) onUploadComplete();
+    });
+    events.addEventListener("failed", () => {
+      events.close();
+      setStatus("Categorization failed. Transactions are saved uncategorized.");
+    });
+    events.addEventListener("error", (e) => {
+      // Server-sent "error" events carry data; connection errors are retried by EventSource
+      if (e.data) events.close();
+    });
+  };
+
   const handleFileChange = (e) => {
     setFile(e.target.files[0]);
   };
@@ -37,6 +59,9 @@ const UploadForm = ({ onUploadComplete }) => {
       // 🟢 Notify dashboard to refresh statements
       if (onUploadComplete) onUploadComplete();
 
+      // 🏷️ Follow categorization, then refresh once more when it's done
+      if (response.data?.job_id) watchEnrichment(response.data.upload_id);
+
     } catch (error) {
       console.error("Upload failed", error);
       setStatus("Upload failed. Check console.");